@@ -0,0 +1,513 @@
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import homework
+
+SAMPLE_PACKAGES = {
+    'SWM': [720, 1, 80, 25, 40],
+    'RUN': [15000, 1, 75],
+    'WLK': [9000, 1, 75, 180],
+}
+STARTUP_REPEAT = 20
+DEFAULT_SIZES = (1_000, 100_000)
+DEFAULT_THRESHOLD = 0.2
+HIGHER_IS_BETTER = ('packets/s', '%')
+RESULT_MESSAGE = '{name:<48} {value:>14,.0f} {unit}'
+REGRESSION_MESSAGE = (
+    'Регрессия {name}: {baseline:,.0f} -> {value:,.0f} {unit} '
+    '({change:+.1%})'
+)
+
+Results = Dict[str, Tuple[float, str]]
+
+
+def with_unit(results: Dict[str, float], unit: str) -> Results:
+    return {name: (value, unit) for name, value in results.items()}
+
+
+def measure_memory(build: Callable[[], object]) -> int:
+    tracemalloc.start()
+    try:
+        result = build()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current
+
+
+def bench_memory(count: int) -> Results:
+    results = {}
+    for workout_type, data in SAMPLE_PACKAGES.items():
+        action_type, _ = homework.PACK_ACTIONS[workout_type]
+        results[f'memory.dataclass.{workout_type}'] = measure_memory(
+            lambda: [action_type(*data) for _ in range(count)]
+        )
+        results[f'memory.table.{workout_type}'] = measure_memory(
+            lambda: homework.TrainingTable(
+                workout_type, (data for _ in range(count))
+            )
+        )
+    return with_unit(results, 'bytes')
+
+
+def measure_time(run: Callable[[], object], count: int) -> float:
+    return min(timeit.repeat(run, number=1, repeat=3)) / count * 1e9
+
+
+def sample_packages(count: int) -> list:
+    return list(SAMPLE_PACKAGES.items()) * max(
+        count // len(SAMPLE_PACKAGES), 1
+    )
+
+
+def bench_formulas(count: int) -> Results:
+    results = {}
+    for workout_type, data in SAMPLE_PACKAGES.items():
+        action_type, _ = homework.PACK_ACTIONS[workout_type]
+        trainings = [action_type(*data) for _ in range(count)]
+        results[f'{action_type.__name__}.get_spent_calories'] = measure_time(
+            lambda: [training.get_spent_calories() for training in trainings],
+            count
+        )
+    return with_unit(results, 'ns/packet')
+
+
+def bench_messages(count: int) -> Results:
+    trainings = [
+        homework.read_package(*package) for package in sample_packages(count)
+    ]
+    messages = [training.show_training_info() for training in trainings]
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            main_time = measure_time(
+                lambda: [homework.main(training) for training in trainings],
+                len(trainings)
+            )
+    return with_unit({
+        'show_training_info': measure_time(
+            lambda: [training.show_training_info() for training in trainings],
+            len(trainings)
+        ),
+        'get_message': measure_time(
+            lambda: [message.get_message() for message in messages],
+            len(messages)
+        ),
+        'render_messages': measure_time(
+            lambda: homework.render_messages(messages), len(messages)
+        ),
+        'main': main_time,
+    }, 'ns/packet')
+
+
+def bench_read_package(count: int) -> Results:
+    packages = sample_packages(count)
+    count = len(packages)
+    read_package = homework.read_package
+    return with_unit({
+        'read_package': measure_time(
+            lambda: [read_package(*package) for package in packages],
+            count
+        ),
+        'read_package.trusted': measure_time(
+            lambda: [
+                read_package(workout_type, data, trusted=True)
+                for workout_type, data in packages
+            ],
+            count
+        ),
+        'read_packages': measure_time(
+            lambda: homework.read_packages(packages), count
+        ),
+        'read_packages.trusted': measure_time(
+            lambda: homework.read_packages(packages, trusted=True), count
+        ),
+    }, 'ns/packet')
+
+
+def bench_binary(count: int) -> Results:
+    packages = sample_packages(count)
+    count = len(packages)
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, 'packets.jsonl')
+        binary_path = os.path.join(directory, 'packets.bin')
+        with open(text_path, 'w', encoding='utf-8') as target:
+            for package in packages:
+                target.write(json.dumps(package) + '\n')
+        homework.write_binary_packets(binary_path, packages)
+
+        def read_text() -> list:
+            with open(text_path, encoding='utf-8') as source:
+                return list(homework.read_stream(source))
+
+        def read_binary() -> list:
+            with homework.BinaryPacketReader(binary_path) as reader:
+                return list(reader.trainings())
+
+        def compute_binary() -> list:
+            with homework.BinaryPacketReader(binary_path) as reader:
+                return [
+                    homework.compute_batch(workout_type, columns)
+                    for workout_type, columns in reader.columns().items()
+                ]
+
+        return with_unit({
+            'binary.write': measure_time(
+                lambda: homework.write_binary_packets(binary_path, packages),
+                count
+            ),
+            'binary.read_text': measure_time(read_text, count),
+            'binary.read_binary': measure_time(read_binary, count),
+            'binary.compute_batch': measure_time(compute_binary, count),
+        }, 'ns/packet')
+
+
+def bench_cache(count: int, distinct: int = 100) -> Results:
+    unique = [
+        (workout_type, [data[0] + index, *data[1:]])
+        for index, (workout_type, data) in enumerate(
+            sample_packages(distinct)
+        )
+    ][:distinct]
+    packages = [
+        unique[index % len(unique)] for index in range(max(count, 1))
+    ]
+    count = len(packages)
+
+    def show() -> List[object]:
+        return [
+            homework.read_package(*package).show_training_info()
+            for package in packages
+        ]
+
+    def lru_pass() -> List[object]:
+        homework.packet_cache_clear()
+        return [
+            homework.cached_training_info(*package) for package in packages
+        ]
+
+    results = {
+        'cache.read_and_show': (measure_time(show, count), 'ns/packet'),
+        'cache.lru_training_info': (
+            measure_time(lru_pass, count), 'ns/packet'
+        ),
+    }
+    lru_pass()
+    info = homework.packet_cache_info()
+    results['cache.lru_hit_rate'] = (
+        100 * info.hits / (info.hits + info.misses), '%'
+    )
+    return results
+
+
+def bench_registry(count: int) -> Results:
+    packages = sample_packages(count)
+    registry = homework.WORKOUT_REGISTRY
+    columns = {}
+    for workout_type, data in packages:
+        type_columns = columns.setdefault(workout_type, {
+            name: [] for name in registry[workout_type].fields
+        })
+        for name, value in zip(registry[workout_type].fields, data):
+            type_columns[name].append(value)
+    return with_unit({
+        'registry.scalar': measure_time(
+            lambda: [
+                registry[workout_type].compute(data)
+                for workout_type, data in packages
+            ],
+            len(packages)
+        ),
+        'registry.batch': measure_time(
+            lambda: [
+                registry[workout_type].compute_batch(type_columns)
+                for workout_type, type_columns in columns.items()
+            ],
+            len(packages)
+        ),
+        'registry.compute_batch': measure_time(
+            lambda: [
+                homework.compute_batch(workout_type, type_columns)
+                for workout_type, type_columns in columns.items()
+            ],
+            len(packages)
+        ),
+    }, 'ns/packet')
+
+
+def bench_threads(count: int, batch_size: int = 100) -> Results:
+    packages = sample_packages(count)
+    batches = [
+        packages[start:start + batch_size]
+        for start in range(0, len(packages), batch_size)
+    ]
+
+    def main_per_request() -> None:
+        with open(os.devnull, 'w', encoding='utf-8') as devnull:
+            with contextlib.redirect_stdout(devnull):
+                for batch in batches:
+                    for package in batch:
+                        homework.main(homework.read_package(*package))
+
+    results = {'threads.main_per_request': (
+        len(packages) / measure_time(main_per_request, 1) * 1e9, 'packets/s'
+    )}
+    for threads in sorted({1, 2, 4, os.cpu_count() or 1}):
+        with homework.BatchWorkerPool(threads) as pool:
+            results[f'threads.pool.{threads}'] = (
+                len(packages) / measure_time(
+                    lambda: list(pool.map(batches)), 1
+                ) * 1e9,
+                'packets/s'
+            )
+    return results
+
+
+def bench_validation(count: int) -> Results:
+    packages = [
+        package if index % 2 else (package[0], package[1][:-1])
+        for index, package in enumerate(sample_packages(count))
+    ]
+
+    def read_with_exceptions() -> list:
+        errors = []
+        for package in packages:
+            try:
+                homework.read_package(*package)
+            except ValueError as error:
+                errors.append(error)
+        return errors
+
+    return with_unit({
+        'validation.exceptions': measure_time(
+            read_with_exceptions, len(packages)
+        ),
+        'validation.validate_packets': measure_time(
+            lambda: homework.validate_packets(packages), len(packages)
+        ),
+    }, 'ns/packet')
+
+
+def synthetic_columns(count: int) -> Dict[str, Dict[str, list]]:
+    columns = {}
+    for workout_type, data in homework.generate_packets(count):
+        action_type, _ = homework.PACK_ACTIONS[workout_type]
+        type_columns = columns.setdefault(workout_type, {
+            field.name: [] for field in homework.fields(action_type)
+        })
+        for column, value in zip(type_columns.values(), data):
+            column.append(value)
+    return columns
+
+
+def bench_precision(count: int) -> Results:
+    columns = synthetic_columns(count)
+    results = {}
+    for typecode in homework.BATCH_TYPECODES:
+        batches = [
+            homework.compute_batch(workout_type, type_columns, typecode)
+            for workout_type, type_columns in columns.items()
+        ]
+        results[f'precision.time.{typecode}'] = (measure_time(
+            lambda: [
+                homework.compute_batch(workout_type, type_columns, typecode)
+                for workout_type, type_columns in columns.items()
+            ],
+            count
+        ), 'ns/packet')
+        results[f'precision.bytes.{typecode}'] = (sum(
+            len(column) * column.itemsize
+            for batch in batches
+            for column in (batch.distance, batch.speed, batch.calories)
+        ), 'bytes')
+    results['precision.diverging_rows'] = (sum(
+        len(homework.compare_batch_precision(workout_type, type_columns))
+        for workout_type, type_columns in columns.items()
+    ), 'rows')
+    return results
+
+
+def bytecode_env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.pop('PYTHONDONTWRITEBYTECODE', None)
+    return env
+
+
+def import_time() -> float:
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import homework'],
+        capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(homework.__file__)),
+        env=bytecode_env()
+    )
+    for line in result.stderr.splitlines():
+        _, cumulative, name = line.split('|')
+        if name.strip() == 'homework':
+            return float(cumulative)
+    raise RuntimeError(result.stderr)
+
+
+def bench_startup(count: int) -> Results:
+    script = os.path.abspath(homework.__file__)
+
+    def run_cli() -> None:
+        subprocess.run(
+            [sys.executable, script], capture_output=True, check=True,
+            env=bytecode_env()
+        )
+
+    import_time()
+    return {
+        'startup.import_homework': (
+            min(import_time() for _ in range(STARTUP_REPEAT)), 'us'
+        ),
+        'startup.cli': (
+            min(timeit.repeat(run_cli, number=1, repeat=STARTUP_REPEAT))
+            * 1e6,
+            'us'
+        ),
+    }
+
+
+async def load_server(count: int, clients: int) -> Results:
+    server = await homework.serve_packets()
+    host, port = server.sockets[0].getsockname()[:2]
+    lines = [
+        (json.dumps(package) + '\n').encode('utf-8')
+        for package in SAMPLE_PACKAGES.items()
+    ]
+    latencies = []
+
+    async def client(requests: int) -> None:
+        reader, writer = await asyncio.open_connection(host, port)
+        for index in range(requests):
+            start = time.perf_counter_ns()
+            writer.write(lines[index % len(lines)])
+            await writer.drain()
+            await reader.readline()
+            latencies.append(time.perf_counter_ns() - start)
+        writer.close()
+        await writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(count // clients) for _ in range(clients)])
+    elapsed = time.perf_counter() - start
+    server.close()
+    await server.wait_closed()
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        'server.latency.p50': (percentiles[49], 'ns'),
+        'server.latency.p99': (percentiles[98], 'ns'),
+        'server.throughput': (len(latencies) / elapsed, 'packets/s'),
+    }
+
+
+def bench_server(count: int, clients: int = 8) -> Results:
+    return asyncio.run(load_server(min(count, 20_000), clients))
+
+
+BENCHMARKS = {
+    'memory': bench_memory,
+    'read_package': bench_read_package,
+    'formulas': bench_formulas,
+    'messages': bench_messages,
+    'binary': bench_binary,
+    'server': bench_server,
+    'cache': bench_cache,
+    'registry': bench_registry,
+    'threads': bench_threads,
+    'startup': bench_startup,
+    'validation': bench_validation,
+    'precision': bench_precision,
+}
+
+
+def run_benchmarks(names, sizes) -> Results:
+    results = {}
+    for size in sizes:
+        for name in names:
+            for result_name, result in BENCHMARKS[name](size).items():
+                results[f'{result_name}@{size}'] = result
+    return results
+
+
+def find_regressions(
+    results: Results, baseline: Results, threshold: float
+) -> list:
+    regressions = []
+    for name, (value, unit) in results.items():
+        if name not in baseline or not baseline[name][0]:
+            continue
+        change = value / baseline[name][0] - 1
+        if unit in HIGHER_IS_BETTER:
+            change = -change
+        if change > threshold:
+            regressions.append(REGRESSION_MESSAGE.format(
+                name=name,
+                baseline=baseline[name][0],
+                value=value,
+                unit=unit,
+                change=change
+            ))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Бенчмарки модуля фитнес-трекера.'
+    )
+    parser.add_argument(
+        'names', nargs='*',
+        help=f'бенчмарки для запуска: {", ".join(BENCHMARKS)}; '
+             'по умолчанию все'
+    )
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+        help='количество пакетов, например 1000 100000 10000000'
+    )
+    parser.add_argument('--json', help='записать результаты в JSON-файл')
+    parser.add_argument(
+        '--baseline', help='JSON-файл прошлого запуска для сравнения'
+    )
+    parser.add_argument(
+        '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='допустимое ухудшение относительно baseline, доля'
+    )
+    args = parser.parse_args(argv)
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f'неизвестные бенчмарки: {", ".join(sorted(unknown))}')
+
+    results = run_benchmarks(args.names or list(BENCHMARKS), args.sizes)
+    for name, (value, unit) in results.items():
+        print(RESULT_MESSAGE.format(name=name, value=value, unit=unit))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as target:
+            json.dump(results, target, indent=2, ensure_ascii=False)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as source:
+            baseline = json.load(source)
+        regressions = find_regressions(results, baseline, args.threshold)
+        for regression in regressions:
+            print(regression, file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
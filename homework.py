@@ -1,11 +1,35 @@
-from dataclasses import dataclass, fields, asdict
-from typing import ClassVar
+import csv
+import json
+import os
+import struct
+import sys
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, fields
+from functools import lru_cache, partial, wraps
+from heapq import heappush, heapreplace
+from itertools import islice, repeat
+from operator import attrgetter
+from typing import (
+    Callable, ClassVar, Dict, Iterable, Iterator, List, Mapping, Optional,
+    TYPE_CHECKING, Sequence, TextIO, Tuple
+)
+
+if TYPE_CHECKING:
+    import argparse
+    import asyncio
+    import random
+    import types
+    from concurrent.futures import Future
 
 INFO_MESSAGE = ('Тип тренировки: {training_type};'
                 ' Длительность: {duration:.3f} ч.;'
                 ' Дистанция: {distance:.3f} км;'
                 ' Ср. скорость: {speed:.3f} км/ч;'
                 ' Потрачено ккал: {calories:.3f}.')
+INFO_MESSAGE_LINE = INFO_MESSAGE + '\n'
 
 MESSAGE_ERR_TYPE_ACT = ('Передан не верный тип тренировки: {workout_type}')
 MESSAGE_ERR_TYPE_ARGUMEN = (
@@ -13,6 +37,173 @@ MESSAGE_ERR_TYPE_ARGUMEN = (
     ' {len_argument_false} должно быть {len_argument_true}. '
     'Переданные аргументы: {argument_return}'
 )
+MESSAGE_ERR_ARGUMENT_KIND = (
+    'В классе {action_class} аргумент {field_name} должен быть числом, '
+    'получено: {value!r}'
+)
+MESSAGE_ERR_ARGUMENT_DATA = (
+    'В классе {action_class} аргументы должны быть списком, '
+    'получено: {value!r}'
+)
+MESSAGE_ERR_ARGUMENT_RANGE = (
+    'В классе {action_class} недопустимое значение {field_name}: {value}'
+)
+MESSAGE_ERR_BATCH_COLUMNS = (
+    'Для класса {action_class} переданы не все колонки: '
+    'не хватает {missing_columns}'
+)
+MESSAGE_ERR_BATCH_LENGTH = (
+    'Колонки пакета {action_class} должны быть одной длины, '
+    'получено: {column_lengths}'
+)
+MESSAGE_ERR_TYPECODE = (
+    'Неподдерживаемая точность пакетного расчёта: {typecode!r}, '
+    'допустимые значения: {typecodes}'
+)
+MESSAGE_ERR_PROFILE_UNKNOWN = 'Профиль пользователя {user_id!r} не найден'
+MESSAGE_ERR_PROFILE_FIELD = (
+    'В профиле пользователя {user_id!r} не задано поле {field_name}'
+)
+MESSAGE_ERR_SERVER_LINE = 'Строка пакета длиннее {limit} байт'
+MESSAGE_ERR_PACKET = 'Не удалось разобрать пакет: {line!r}'
+MESSAGE_ERR_CALCULATION = 'Не удалось рассчитать тренировку: {error!r}'
+MESSAGE_ERR_FORMAT = 'Неизвестный формат пакетов: {packet_format}'
+MESSAGE_ERR_ROLLING_ORDER = (
+    'Пакет за день {day} пришёл после пакетов за день {last_day}'
+)
+MESSAGE_ERR_ROLLING_WINDOW = 'Окно {days} дн. не настроено'
+MESSAGE_ERR_SESSION_PROFILE = (
+    'Для сессии {action_class} не хватает параметров: {missing_fields}'
+)
+MESSAGE_ERR_SESSION_ORDER = (
+    'Отсчёт {timestamp} пришёл раньше предыдущего {last_timestamp}'
+)
+MESSAGE_ERR_SESSION_EMPTY = 'Сессия {action_class} ещё не имеет длительности'
+MESSAGE_ERR_WORKOUT_EXISTS = 'Тип тренировки {code} уже зарегистрирован'
+MESSAGE_ERR_WORKOUT_FIELDS = (
+    'Поля тренировки {name} должны начинаться с {training_fields}, '
+    'получено: {fields}'
+)
+MESSAGE_ERR_NPY_HEADER = 'Файл {path} не является колонкой .npy'
+MESSAGE_ERR_NPY_WIDTH = (
+    'Тип тренировки {training_type} длиннее {width} символов'
+)
+MESSAGE_ERR_BINARY_HEADER = 'Файл {path} не является бинарным архивом пакетов'
+MESSAGE_ERR_BINARY_SIZE = (
+    'Файл {path} обрезан: длина записей не кратна {size} байтам'
+)
+MESSAGE_ERR_BINARY_RECORD = (
+    'Пакет {workout_type} не помещается в бинарную запись: '
+    'код до {code_width} байт, до {slots} полей'
+)
+
+BATCH_TYPECODES = ('d', 'f')
+PACKET_FORMATS = ('jsonl', 'csv')
+STREAM_CHUNK_SIZE = 1024
+SECONDS_IN_DAY = 24 * 60 * 60
+SECONDS_IN_HOUR = 60 * 60
+SESSION_COUNTERS = ('action', 'count_pool')
+SYNTHETIC_MIX = {'RUN': 0.5, 'WLK': 0.3, 'SWM': 0.2}
+SYNTHETIC_RANGES = {
+    'action': (500, 30_000),
+    'duration': (0.25, 3.0),
+    'weight': (45.0, 120.0),
+    'height': (150.0, 200.0),
+    'length_pool': (25.0, 50.0),
+    'count_pool': (10, 80),
+}
+SYNTHETIC_INTEGER_FIELDS = ('action', 'count_pool')
+TOP_K = 10
+TOP_BUCKET_SECONDS = 7 * SECONDS_IN_DAY
+# Опубликованная оценка нормированной ошибки ранга KLL-скетча при k = 200
+# составляет ~1.65% (с вероятностью 99%); на практике ранг оценки квантиля q
+# обычно укладывается в q ± 0.01.
+SKETCH_K = 200
+SKETCH_CAPACITY_FACTOR = 2 / 3
+SKETCH_MIN_CAPACITY = 2
+SKETCH_METRICS = ('speed', 'calories')
+SKETCH_QUANTILES = (0.5, 0.9, 0.99)
+ROLLING_WINDOWS = (7, 30)
+PACKET_CACHE_SIZE = 4096
+PROFILE_TOP = 25
+RESULT_CACHE_SIZE = 10_000
+FILE_DIGEST_CHUNK = 1 << 20
+PROFILE_CACHE_SIZE = 10_000
+PROFILE_FIELDS = ('weight', 'height')
+ERR_WORKOUT_TYPE = 1
+ERR_ARGUMENT_COUNT = 2
+ERR_ARGUMENT_KIND = 3
+ERR_ARGUMENT_RANGE = 4
+NUMERIC_TYPES = (int, float)
+PACKET_DATA_TYPES = (list, tuple)
+FIELD_LOWER_BOUNDS = {
+    'action': (0, False),
+    'duration': (0, True),
+    'weight': (0, True),
+    'height': (0, True),
+    'length_pool': (0, True),
+    'count_pool': (0, False),
+}
+DEDUP_CAPACITY = 1 << 20
+DEDUP_DIGEST_SIZE = 8
+DEDUP_TABLE_SIZE = 8
+WORKER_THREADS = 4
+TRAINING_FIELDS = ('action', 'duration', 'weight')
+TRAINING_METHODS = ('get_distance', 'get_mean_speed', 'get_spent_calories')
+WORKOUT_KERNELS = (*TRAINING_METHODS, 'scalar', 'batch')
+WORKOUT_KERNEL_SOURCE = '''
+def get_distance({arguments}):
+    return {distance}
+
+
+def get_mean_speed({arguments}, distance):
+    return {speed}
+
+
+def get_spent_calories({arguments}, speed):
+    return {calories}
+
+
+def scalar({arguments}):
+    distance = {distance}
+    speed = {speed}
+    return distance, speed, {calories}
+
+
+def batch(columns, typecode='d'):
+    distance_column = array(typecode)
+    speed_column = array(typecode)
+    calories_column = array(typecode)
+    for {arguments} in zip(*columns):
+        distance = {distance}
+        speed = {speed}
+        distance_column.append(distance)
+        speed_column.append(speed)
+        calories_column.append({calories})
+    return distance_column, speed_column, calories_column
+'''
+SERVER_READ_SIZE = 64 * 1024
+SERVER_ERROR_LINE = 'Ошибка: {error}\n'
+NPY_MAGIC = b'\x93NUMPY\x01\x00'
+NPY_HEADER_SIZE = 128
+NPY_HEADER = (
+    "{{'descr': '{descr}', 'fortran_order': False, 'shape': ({rows},), }}"
+)
+NPY_TYPE_WIDTH = 32
+NPY_COLUMNS = {
+    'training_type': f'<U{NPY_TYPE_WIDTH}',
+    'duration': '<f8',
+    'distance': '<f8',
+    'speed': '<f8',
+    'calories': '<f8',
+}
+BINARY_HEADER = b'HWPK\x01\x00\x00\x00'
+BINARY_CODE_WIDTH = 3
+BINARY_SLOTS = 5
+BINARY_RECORD = struct.Struct(f'<{BINARY_CODE_WIDTH}sx{BINARY_SLOTS}d')
+
+Packet = Tuple[str, List[float]]
+DeadLetterSink = Callable[[str, ValueError], None]
 
 
 @dataclass
@@ -24,7 +215,95 @@ class InfoMessage:
     calories: float
 
     def get_message(self) -> str:
-        return INFO_MESSAGE.format(**asdict(self))
+        return INFO_MESSAGE.format(
+            training_type=self.training_type,
+            duration=self.duration,
+            distance=self.distance,
+            speed=self.speed,
+            calories=self.calories
+        )
+
+
+@dataclass
+class BatchInfo:
+    training_type: str
+    duration: Sequence[float]
+    distance: array
+    speed: array
+    calories: array
+
+
+@dataclass
+class WorkoutTotals:
+    count: int = 0
+    duration: float = 0.0
+    distance: float = 0.0
+    speed_time: float = 0.0
+    calories: float = 0.0
+
+    @property
+    def mean_speed(self) -> float:
+        if not self.duration:
+            return 0.0
+        return self.speed_time / self.duration
+
+    def add(self, message: InfoMessage) -> None:
+        self.count += 1
+        self.duration += message.duration
+        self.distance += message.distance
+        self.speed_time += message.speed * message.duration
+        self.calories += message.calories
+
+    def merge(self, other: 'WorkoutTotals') -> None:
+        self.count += other.count
+        self.duration += other.duration
+        self.distance += other.distance
+        self.speed_time += other.speed_time
+        self.calories += other.calories
+
+    def subtract(self, other: 'WorkoutTotals') -> None:
+        self.count -= other.count
+        self.duration -= other.duration
+        self.distance -= other.distance
+        self.speed_time -= other.speed_time
+        self.calories -= other.calories
+
+
+@dataclass
+class ArchiveSummary:
+    totals: Dict[str, WorkoutTotals] = field(default_factory=dict)
+    rejected: int = 0
+
+    def add(self, message: InfoMessage) -> None:
+        self.totals.setdefault(
+            message.training_type, WorkoutTotals()
+        ).add(message)
+
+    def merge(self, other: 'ArchiveSummary') -> None:
+        for training_type, totals in other.totals.items():
+            self.totals.setdefault(
+                training_type, WorkoutTotals()
+            ).merge(totals)
+        self.rejected += other.rejected
+
+    def to_dict(self) -> dict:
+        return {
+            'totals': {
+                training_type: vars(totals).copy()
+                for training_type, totals in self.totals.items()
+            },
+            'rejected': self.rejected
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'ArchiveSummary':
+        return cls(
+            {
+                training_type: WorkoutTotals(**totals)
+                for training_type, totals in state['totals'].items()
+            },
+            state['rejected']
+        )
 
 
 @dataclass
@@ -54,6 +333,38 @@ class Training:
             self.get_spent_calories()
         )
 
+    @classmethod
+    def get_batch_distance(
+        cls, columns: Mapping[str, Sequence[float]], typecode: str = 'd'
+    ) -> array:
+        return array(typecode, [
+            action * cls.LEN_STEP / cls.M_IN_KM
+            for action in columns['action']
+        ])
+
+    @classmethod
+    def get_batch_mean_speed(
+        cls,
+        columns: Mapping[str, Sequence[float]],
+        distance: array,
+        typecode: str = 'd'
+    ) -> array:
+        return array(typecode, [
+            distance_row / duration
+            for distance_row, duration in zip(distance, columns['duration'])
+        ])
+
+    @classmethod
+    def get_batch_spent_calories(
+        cls,
+        columns: Mapping[str, Sequence[float]],
+        speed: array,
+        typecode: str = 'd'
+    ) -> array:
+        raise NotImplementedError(
+            f'В классе {cls.__name__} не задан пакетный расчёт калорий'
+        )
+
 
 @dataclass
 class Running(Training):
@@ -75,6 +386,27 @@ class Running(Training):
             )
         )
 
+    @classmethod
+    def get_batch_spent_calories(
+        cls,
+        columns: Mapping[str, Sequence[float]],
+        speed: array,
+        typecode: str = 'd'
+    ) -> array:
+        return array(typecode, [
+            (
+                cls.CALORIES_MEAN_SPEED_MULTIPLIER
+                * speed_row
+                + cls.CALORIES_MEAN_SPEED_SHIFT
+            )
+            * weight
+            / cls.M_IN_KM
+            * (duration * cls.MIN_IN_H)
+            for speed_row, weight, duration in zip(
+                speed, columns['weight'], columns['duration']
+            )
+        ])
+
 
 @dataclass
 class SportsWalking(Training):
@@ -114,6 +446,34 @@ class SportsWalking(Training):
             * (self.duration * self.MIN_IN_H)
         )
 
+    @classmethod
+    def get_batch_spent_calories(
+        cls,
+        columns: Mapping[str, Sequence[float]],
+        speed: array,
+        typecode: str = 'd'
+    ) -> array:
+        return array(typecode, [
+            (
+                cls.CALORIES_WEIGHT_MULTIPLIER
+                * weight
+                + (
+                    (speed_row * cls.KMH_IN_MSEC)
+                    ** 2
+                    / (height / cls.CM_IN_M)
+                )
+                * cls.CALORIES_SPEED_HEIGHT_MULTIPLIER
+                * weight
+            )
+            * (duration * cls.MIN_IN_H)
+            for speed_row, weight, height, duration in zip(
+                speed,
+                columns['weight'],
+                columns['height'],
+                columns['duration']
+            )
+        ])
+
 
 @dataclass
 class Swimming(Training):
@@ -142,6 +502,379 @@ class Swimming(Training):
             * self.duration
         )
 
+    @classmethod
+    def get_batch_mean_speed(
+        cls,
+        columns: Mapping[str, Sequence[float]],
+        distance: array,
+        typecode: str = 'd'
+    ) -> array:
+        return array(typecode, [
+            length_pool * count_pool / cls.M_IN_KM / duration
+            for length_pool, count_pool, duration in zip(
+                columns['length_pool'],
+                columns['count_pool'],
+                columns['duration']
+            )
+        ])
+
+    @classmethod
+    def get_batch_spent_calories(
+        cls,
+        columns: Mapping[str, Sequence[float]],
+        speed: array,
+        typecode: str = 'd'
+    ) -> array:
+        return array(typecode, [
+            (speed_row + cls.MEAN_SPEED_MULTIPLER)
+            * cls.HEIGHT_MULTIPLER
+            * weight
+            * duration
+            for speed_row, weight, duration in zip(
+                speed, columns['weight'], columns['duration']
+            )
+        ])
+
+
+@dataclass
+class RollingWindow:
+    days: int
+    buckets: deque = field(default_factory=deque)
+    totals: WorkoutTotals = field(default_factory=WorkoutTotals)
+
+    def add(
+        self, day: int, bucket: WorkoutTotals, totals: WorkoutTotals
+    ) -> None:
+        if not self.buckets or self.buckets[-1][0] != day:
+            self.buckets.append((day, bucket))
+        self.totals.merge(totals)
+        self.expire(day)
+
+    def expire(self, day: int) -> None:
+        while self.buckets and self.buckets[0][0] <= day - self.days:
+            _, bucket = self.buckets.popleft()
+            self.totals.subtract(bucket)
+
+    def totals_at(self, day: int) -> WorkoutTotals:
+        totals = WorkoutTotals(**vars(self.totals))
+        for bucket_day, bucket in self.buckets:
+            if bucket_day > day - self.days:
+                break
+            totals.subtract(bucket)
+        return totals
+
+
+class RollingAggregator:
+    def __init__(self, windows: Sequence[int] = ROLLING_WINDOWS) -> None:
+        self.windows = tuple(sorted(windows))
+        self.keys: Dict[tuple, Dict[int, RollingWindow]] = {}
+
+    def add(
+        self, user_id, timestamp: float, message: InfoMessage
+    ) -> None:
+        totals = WorkoutTotals()
+        totals.add(message)
+        self._add_totals(
+            (user_id, message.training_type),
+            int(timestamp // SECONDS_IN_DAY),
+            totals
+        )
+
+    def add_training(
+        self, user_id, timestamp: float, training: Training
+    ) -> None:
+        self.add(user_id, timestamp, training.show_training_info())
+
+    def _add_totals(
+        self, key: tuple, day: int, totals: WorkoutTotals
+    ) -> None:
+        windows = self.keys.get(key)
+        if windows is None:
+            windows = self.keys[key] = {
+                days: RollingWindow(days) for days in self.windows
+            }
+        longest = windows[self.windows[-1]]
+        if longest.buckets and longest.buckets[-1][0] > day:
+            raise ValueError(MESSAGE_ERR_ROLLING_ORDER.format(
+                day=day, last_day=longest.buckets[-1][0]
+            ))
+
+        if longest.buckets and longest.buckets[-1][0] == day:
+            bucket = longest.buckets[-1][1]
+        else:
+            bucket = WorkoutTotals()
+        bucket.merge(totals)
+        for window in windows.values():
+            window.add(day, bucket, totals)
+
+    def totals(
+        self,
+        user_id,
+        training_type: str,
+        days: int,
+        now: Optional[float] = None
+    ) -> WorkoutTotals:
+        if days not in self.windows:
+            raise ValueError(MESSAGE_ERR_ROLLING_WINDOW.format(days=days))
+        windows = self.keys.get((user_id, training_type))
+        if windows is None:
+            return WorkoutTotals()
+        window = windows[days]
+        if now is not None:
+            return window.totals_at(int(now // SECONDS_IN_DAY))
+        return WorkoutTotals(**vars(window.totals))
+
+    def snapshot(self) -> dict:
+        return {
+            'windows': list(self.windows),
+            'keys': [
+                {
+                    'user_id': user_id,
+                    'training_type': training_type,
+                    'buckets': [
+                        [day, vars(bucket).copy()]
+                        for day, bucket in windows[self.windows[-1]].buckets
+                    ]
+                }
+                for (user_id, training_type), windows in self.keys.items()
+            ]
+        }
+
+    @classmethod
+    def restore(cls, snapshot: dict) -> 'RollingAggregator':
+        aggregator = cls(snapshot['windows'])
+        for entry in snapshot['keys']:
+            for day, bucket in entry['buckets']:
+                aggregator._add_totals(
+                    (entry['user_id'], entry['training_type']),
+                    day,
+                    WorkoutTotals(**bucket)
+                )
+        return aggregator
+
+
+class TopKIndex:
+    def __init__(
+        self,
+        k: int = TOP_K,
+        metric: str = 'calories',
+        bucket_seconds: float = TOP_BUCKET_SECONDS
+    ) -> None:
+        self.k = k
+        self.metric = metric
+        self.bucket_seconds = bucket_seconds
+        self.heaps: Dict[Tuple[str, int], list] = {}
+        self.sequence = 0
+
+    def bucket(self, timestamp: float) -> int:
+        return int(timestamp // self.bucket_seconds)
+
+    def add(self, timestamp: float, message: InfoMessage) -> None:
+        self._push(
+            (message.training_type, self.bucket(timestamp)),
+            getattr(message, self.metric),
+            message
+        )
+
+    def _push(
+        self, key: Tuple[str, int], value: float, message: InfoMessage
+    ) -> None:
+        heap = self.heaps.setdefault(key, [])
+        entry = (value, self.sequence, message)
+        self.sequence += 1
+        if len(heap) < self.k:
+            heappush(heap, entry)
+        elif value > heap[0][0]:
+            heapreplace(heap, entry)
+
+    def top(self, training_type: str, bucket: int) -> List[InfoMessage]:
+        return [
+            message for _, _, message in sorted(
+                self.heaps.get((training_type, bucket), []),
+                key=lambda entry: (-entry[0], entry[1])
+            )
+        ]
+
+    def expire(self, before_bucket: int) -> None:
+        for key in [key for key in self.heaps if key[1] < before_bucket]:
+            del self.heaps[key]
+
+    def merge(self, other: 'TopKIndex') -> None:
+        for key, heap in other.heaps.items():
+            for value, _, message in sorted(heap, key=lambda entry: entry[1]):
+                self._push(key, value, message)
+
+
+class QuantileSketch:
+    def __init__(self, k: int = SKETCH_K, seed: int = 0) -> None:
+        import random
+
+        self.k = k
+        self.count = 0
+        self.compactors: List[List[float]] = [[]]
+        self.random = random.Random(seed)
+        self.max_size = self.capacity(0)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(
+            SKETCH_MIN_CAPACITY,
+            int(self.k * SKETCH_CAPACITY_FACTOR ** depth) + 1
+        )
+
+    def size(self) -> int:
+        return sum(len(compactor) for compactor in self.compactors)
+
+    def add(self, value: float) -> None:
+        self.compactors[0].append(value)
+        self.count += 1
+        if len(self.compactors[0]) >= self.capacity(0):
+            self.compress()
+
+    def update(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.add(value)
+
+    def compress(self) -> None:
+        for level, compactor in enumerate(self.compactors):
+            if len(compactor) < self.capacity(level):
+                continue
+            if level + 1 == len(self.compactors):
+                self.compactors.append([])
+                self.max_size = sum(
+                    self.capacity(height)
+                    for height in range(len(self.compactors))
+                )
+            compactor.sort()
+            kept = [compactor.pop()] if len(compactor) % 2 else []
+            self.compactors[level + 1].extend(
+                compactor[self.random.randrange(2)::2]
+            )
+            compactor[:] = kept
+            if self.size() < self.max_size:
+                break
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for compactor, other_compactor in zip(
+            self.compactors, other.compactors
+        ):
+            compactor.extend(other_compactor)
+        self.count += other.count
+        self.max_size = sum(
+            self.capacity(height) for height in range(len(self.compactors))
+        )
+        while self.size() >= self.max_size:
+            self.compress()
+
+    def quantiles(
+        self, fractions: Sequence[float] = SKETCH_QUANTILES
+    ) -> List[float]:
+        weighted = sorted(
+            (value, 1 << level)
+            for level, compactor in enumerate(self.compactors)
+            for value in compactor
+        )
+        if not weighted:
+            return [float('nan')] * len(fractions)
+        cumulative = []
+        total = 0
+        for _, weight in weighted:
+            total += weight
+            cumulative.append(total)
+        return [
+            weighted[min(
+                bisect_left(cumulative, fraction * total), len(weighted) - 1
+            )][0]
+            for fraction in fractions
+        ]
+
+    def to_dict(self) -> dict:
+        return {
+            'k': self.k,
+            'count': self.count,
+            'compactors': [list(compactor) for compactor in self.compactors]
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict, seed: int = 0) -> 'QuantileSketch':
+        sketch = cls(state['k'], seed)
+        sketch.count = state['count']
+        sketch.compactors = [
+            list(compactor) for compactor in state['compactors']
+        ]
+        sketch.max_size = sum(
+            sketch.capacity(height)
+            for height in range(len(sketch.compactors))
+        )
+        return sketch
+
+
+class WorkoutQuantiles:
+    def __init__(self, k: int = SKETCH_K) -> None:
+        self.k = k
+        self.sketches: Dict[str, Dict[str, QuantileSketch]] = {}
+
+    def _sketches(self, training_type: str) -> Dict[str, QuantileSketch]:
+        sketches = self.sketches.get(training_type)
+        if sketches is None:
+            sketches = self.sketches[training_type] = {
+                metric: QuantileSketch(self.k) for metric in SKETCH_METRICS
+            }
+        return sketches
+
+    def add(self, message: InfoMessage) -> None:
+        sketches = self._sketches(message.training_type)
+        for metric, sketch in sketches.items():
+            sketch.add(getattr(message, metric))
+
+    def add_batch(self, batch: BatchInfo) -> None:
+        sketches = self._sketches(batch.training_type)
+        for metric, sketch in sketches.items():
+            sketch.update(getattr(batch, metric))
+
+    def merge(self, other: 'WorkoutQuantiles') -> None:
+        for training_type, other_sketches in other.sketches.items():
+            sketches = self._sketches(training_type)
+            for metric, sketch in other_sketches.items():
+                sketches[metric].merge(sketch)
+
+    def quantiles(
+        self,
+        training_type: str,
+        metric: str,
+        fractions: Sequence[float] = SKETCH_QUANTILES
+    ) -> List[float]:
+        return self._sketches(training_type)[metric].quantiles(fractions)
+
+    def to_dict(self) -> dict:
+        return {
+            'k': self.k,
+            'sketches': {
+                training_type: {
+                    metric: sketch.to_dict()
+                    for metric, sketch in sketches.items()
+                }
+                for training_type, sketches in self.sketches.items()
+            }
+        }
+
+    @classmethod
+    def from_dict(cls, state: dict) -> 'WorkoutQuantiles':
+        quantiles = cls(state['k'])
+        quantiles.sketches = {
+            training_type: {
+                metric: QuantileSketch.from_dict(sketch)
+                for metric, sketch in sketches.items()
+            }
+            for training_type, sketches in state['sketches'].items()
+        }
+        return quantiles
+
 
 PACK_ACTIONS = {
     'SWM': (Swimming, len(fields(Swimming))),
@@ -150,13 +883,166 @@ PACK_ACTIONS = {
 }
 
 
-def read_package(workout_type: str, data: int) -> Training:
-    if workout_type not in PACK_ACTIONS:
+PACK_CONSTRUCTORS = {
+    workout_type: action_type
+    for workout_type, (action_type, _) in PACK_ACTIONS.items()
+}
+
+
+def workout_constants(action_type: type) -> Dict[str, float]:
+    return {
+        name: getattr(action_type, name)
+        for name in dir(action_type)
+        if name.isupper()
+    }
+
+
+@dataclass
+class WorkoutSpec:
+    code: str
+    name: str
+    fields: Tuple[str, ...]
+    distance: str
+    speed: str
+    calories: str
+    constants: Dict[str, float]
+
+    def __post_init__(self) -> None:
+        if tuple(self.fields[:len(TRAINING_FIELDS)]) != TRAINING_FIELDS:
+            raise ValueError(MESSAGE_ERR_WORKOUT_FIELDS.format(
+                name=self.name,
+                training_fields=TRAINING_FIELDS,
+                fields=self.fields
+            ))
+
+    def __getattr__(self, name: str) -> Callable:
+        if name not in WORKOUT_KERNELS:
+            raise AttributeError(name)
+        self.compile()
+        return vars(self)[name]
+
+    def compile(self) -> None:
+        source = WORKOUT_KERNEL_SOURCE.format(
+            arguments=', '.join(self.fields),
+            distance=self.distance,
+            speed=self.speed,
+            calories=self.calories
+        )
+        namespace = {'array': array, **self.constants}
+        exec(compile(source, f'<workout {self.code}>', 'exec'), namespace)
+        for name in WORKOUT_KERNELS:
+            setattr(self, name, namespace[name])
+
+    def compute(self, data: Sequence[float]) -> InfoMessage:
+        return InfoMessage(self.name, data[1], *self.scalar(*data))
+
+    def compute_batch(
+        self, columns: Mapping[str, Sequence[float]], typecode: str = 'd'
+    ) -> BatchInfo:
+        return BatchInfo(
+            self.name,
+            columns['duration'],
+            *self.batch([columns[name] for name in self.fields], typecode)
+        )
+
+
+@dataclass
+class CompiledTraining(Training):
+    SPEC: ClassVar[WorkoutSpec]
+    FIELD_VALUES: ClassVar[Callable]
+
+    def get_distance(self) -> float:
+        return self.SPEC.get_distance(*self.FIELD_VALUES(self))
+
+    def get_mean_speed(self) -> float:
+        return self.SPEC.get_mean_speed(
+            *self.FIELD_VALUES(self), self.get_distance()
+        )
+
+    def get_spent_calories(self) -> float:
+        return self.SPEC.get_spent_calories(
+            *self.FIELD_VALUES(self), self.get_mean_speed()
+        )
+
+
+def make_training_class(spec: WorkoutSpec) -> type:
+    extra_fields = spec.fields[len(TRAINING_FIELDS):]
+    namespace = {
+        '__annotations__': {name: float for name in extra_fields},
+        '__module__': __name__,
+        'SPEC': spec,
+        'FIELD_VALUES': attrgetter(*spec.fields),
+        **spec.constants,
+    }
+    return dataclass(type(spec.name, (CompiledTraining,), namespace))
+
+
+def register_workout(spec: WorkoutSpec) -> type:
+    if spec.code in PACK_ACTIONS:
+        raise ValueError(MESSAGE_ERR_WORKOUT_EXISTS.format(code=spec.code))
+
+    action_type = make_training_class(spec)
+    WORKOUT_REGISTRY[spec.code] = spec
+    PACK_ACTIONS[spec.code] = (action_type, len(spec.fields))
+    PACK_CONSTRUCTORS[spec.code] = action_type
+    return action_type
+
+
+WORKOUT_REGISTRY = {
+    'SWM': WorkoutSpec(
+        'SWM', 'Swimming',
+        ('action', 'duration', 'weight', 'length_pool', 'count_pool'),
+        distance='action * LEN_STEP / M_IN_KM',
+        speed='length_pool * count_pool / M_IN_KM / duration',
+        calories=(
+            '(speed + MEAN_SPEED_MULTIPLER)'
+            ' * HEIGHT_MULTIPLER * weight * duration'
+        ),
+        constants=workout_constants(Swimming)
+    ),
+    'RUN': WorkoutSpec(
+        'RUN', 'Running',
+        ('action', 'duration', 'weight'),
+        distance='action * LEN_STEP / M_IN_KM',
+        speed='distance / duration',
+        calories=(
+            '(CALORIES_MEAN_SPEED_MULTIPLIER * speed'
+            ' + CALORIES_MEAN_SPEED_SHIFT)'
+            ' * weight / M_IN_KM * (duration * MIN_IN_H)'
+        ),
+        constants=workout_constants(Running)
+    ),
+    'WLK': WorkoutSpec(
+        'WLK', 'SportsWalking',
+        ('action', 'duration', 'weight', 'height'),
+        distance='action * LEN_STEP / M_IN_KM',
+        speed='distance / duration',
+        calories=(
+            '(CALORIES_WEIGHT_MULTIPLIER * weight'
+            ' + ((speed * KMH_IN_MSEC) ** 2 / (height / CM_IN_M))'
+            ' * CALORIES_SPEED_HEIGHT_MULTIPLIER * weight)'
+            ' * (duration * MIN_IN_H)'
+        ),
+        constants=workout_constants(SportsWalking)
+    ),
+}
+
+
+def read_package(
+    workout_type: str,
+    data: Sequence[float],
+    trusted: bool = False
+) -> Training:
+    if trusted:
+        return PACK_CONSTRUCTORS[workout_type](*data)
+
+    action = PACK_ACTIONS.get(workout_type)
+    if action is None:
         raise ValueError(
             MESSAGE_ERR_TYPE_ACT.format(workout_type=workout_type)
         )
 
-    action_type, len_class_arguments = PACK_ACTIONS[workout_type]
+    action_type, len_class_arguments = action
     if len_class_arguments != len(data):
         raise ValueError(
             MESSAGE_ERR_TYPE_ARGUMEN.format
@@ -168,23 +1054,1642 @@ def read_package(workout_type: str, data: int) -> Training:
             )
         )
 
-    return action_type(*data)
+    return PACK_CONSTRUCTORS[workout_type](*data)
 
 
-def main(training: Training) -> None:
-    print(
-        training.
-        show_training_info().
-        get_message()
+@lru_cache(maxsize=PACKET_CACHE_SIZE)
+def _packet_metrics(
+    workout_type: str, data: Tuple[float, ...]
+) -> Tuple[str, float, float, float, float]:
+    message = read_package(workout_type, data).show_training_info()
+    return (
+        message.training_type,
+        message.duration,
+        message.distance,
+        message.speed,
+        message.calories
     )
 
 
-if __name__ == '__main__':
-    packages = [
-        ('SWM', [720, 1, 80, 25, 40]),
-        ('RUN', [15000, 1, 75]),
-        ('WLK', [9000, 1, 75, 180])
-    ]
+def cached_training_info(
+    workout_type: str, data: Sequence[float]
+) -> InfoMessage:
+    return InfoMessage(*_packet_metrics(workout_type, tuple(data)))
+
 
+packet_cache_info = _packet_metrics.cache_info
+packet_cache_clear = _packet_metrics.cache_clear
+
+
+def check_package(workout_type: str, data: Sequence[float]) -> None:
+    _, len_arguments = PACK_ACTIONS.get(workout_type, (None, None))
+    if len(data) != len_arguments:
+        read_package(workout_type, data)
+
+
+def read_packages(
+    packages: Iterable[Packet], trusted: bool = False
+) -> Dict[str, List[Training]]:
+    grouped: Dict[str, List[Sequence[float]]] = {}
     for workout_type, data in packages:
-        main(read_package(workout_type, data))
+        grouped.setdefault(workout_type, []).append(data)
+
+    trainings = {}
+    for workout_type, rows in grouped.items():
+        if not trusted:
+            for data in rows:
+                check_package(workout_type, data)
+        action_type = PACK_CONSTRUCTORS[workout_type]
+        trainings[workout_type] = [action_type(*data) for data in rows]
+    return trainings
+
+
+@dataclass
+class UserProfile:
+    weight: float
+    height: Optional[float] = None
+
+
+class ProfileStore:
+    def __init__(
+        self, path: str, capacity: int = PROFILE_CACHE_SIZE
+    ) -> None:
+        import sqlite3
+
+        self.capacity = capacity
+        self.recent: OrderedDict = OrderedDict()
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS profiles ('
+            ' user_id TEXT PRIMARY KEY, weight REAL, height REAL)'
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self) -> 'ProfileStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM profiles'
+        ).fetchone()[0]
+
+    def get(self, user_id: str) -> UserProfile:
+        profile = self.recent.get(user_id)
+        if profile is not None:
+            self.recent.move_to_end(user_id)
+            self.hits += 1
+            return profile
+
+        self.misses += 1
+        row = self.connection.execute(
+            'SELECT weight, height FROM profiles WHERE user_id = ?',
+            (user_id,)
+        ).fetchone()
+        if row is None:
+            raise ValueError(
+                MESSAGE_ERR_PROFILE_UNKNOWN.format(user_id=user_id)
+            )
+        profile = UserProfile(*row)
+        self.recent[user_id] = profile
+        if len(self.recent) > self.capacity:
+            self.recent.popitem(last=False)
+        return profile
+
+    def update(self, user_id: str, profile: UserProfile) -> None:
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO profiles VALUES (?, ?, ?)',
+                (user_id, profile.weight, profile.height)
+            )
+        self.invalidate(user_id)
+
+    def invalidate(self, user_id: str) -> None:
+        self.recent.pop(user_id, None)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+@lru_cache(maxsize=None)
+def profile_layout(
+    action_type: type
+) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    names = [field.name for field in fields(action_type)]
+    return (
+        tuple(name for name in names if name not in PROFILE_FIELDS),
+        tuple(name for name in names if name in PROFILE_FIELDS)
+    )
+
+
+def read_profile_package(
+    workout_type: str,
+    user_id: str,
+    data: Sequence[float],
+    profiles: ProfileStore
+) -> Training:
+    action = PACK_ACTIONS.get(workout_type)
+    if action is None:
+        raise ValueError(
+            MESSAGE_ERR_TYPE_ACT.format(workout_type=workout_type)
+        )
+
+    action_type, _ = action
+    names, profile_names = profile_layout(action_type)
+    if len(names) != len(data):
+        raise ValueError(
+            MESSAGE_ERR_TYPE_ARGUMEN.format
+            (
+                action_class=action_type.__name__,
+                len_argument_false=len(data),
+                len_argument_true=len(names),
+                argument_return=data
+            )
+        )
+
+    arguments = dict(zip(names, data))
+    profile = profiles.get(user_id)
+    for field_name in profile_names:
+        value = getattr(profile, field_name)
+        if value is None:
+            raise ValueError(MESSAGE_ERR_PROFILE_FIELD.format(
+                user_id=user_id, field_name=field_name
+            ))
+        arguments[field_name] = value
+    return PACK_CONSTRUCTORS[workout_type](**arguments)
+
+
+class PacketErrors:
+    def __init__(self, packets: Sequence[Packet]) -> None:
+        self.packets = packets
+        self.rows = array('q')
+        self.codes = array('b')
+        self.columns = array('b')
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __getitem__(self, index: int) -> str:
+        return self.message(index)
+
+    def add(self, row: int, code: int, column: int = -1) -> None:
+        self.rows.append(row)
+        self.codes.append(code)
+        self.columns.append(column)
+
+    def message(self, index: int) -> str:
+        workout_type, data = self.packets[self.rows[index]]
+        code = self.codes[index]
+        if code == ERR_WORKOUT_TYPE:
+            return MESSAGE_ERR_TYPE_ACT.format(workout_type=workout_type)
+
+        action_type, len_arguments = PACK_ACTIONS[workout_type]
+        if code == ERR_ARGUMENT_COUNT:
+            return MESSAGE_ERR_TYPE_ARGUMEN.format(
+                action_class=action_type.__name__,
+                len_argument_false=len(data),
+                len_argument_true=len_arguments,
+                argument_return=data
+            )
+
+        column = self.columns[index]
+        if column < 0:
+            return MESSAGE_ERR_ARGUMENT_DATA.format(
+                action_class=action_type.__name__, value=data
+            )
+        message = (
+            MESSAGE_ERR_ARGUMENT_KIND if code == ERR_ARGUMENT_KIND
+            else MESSAGE_ERR_ARGUMENT_RANGE
+        )
+        return message.format(
+            action_class=action_type.__name__,
+            field_name=fields(action_type)[column].name,
+            value=data[column]
+        )
+
+    def messages(self) -> Iterator[str]:
+        for index in range(len(self)):
+            yield self.message(index)
+
+    def valid(self) -> Iterator[Packet]:
+        invalid_rows = set(self.rows)
+        for row, packet in enumerate(self.packets):
+            if row not in invalid_rows:
+                yield packet
+
+
+def field_bounds(action_type: type) -> Tuple[Tuple[int, float, bool], ...]:
+    return tuple(
+        (index, *FIELD_LOWER_BOUNDS[action_field.name])
+        for index, action_field in enumerate(fields(action_type))
+        if action_field.name in FIELD_LOWER_BOUNDS
+    )
+
+
+def validate_packets(packets: Sequence[Packet]) -> PacketErrors:
+    errors = PacketErrors(packets)
+    bounds = {
+        workout_type: (len_arguments, field_bounds(action_type))
+        for workout_type, (action_type, len_arguments)
+        in PACK_ACTIONS.items()
+    }
+    for row, (workout_type, data) in enumerate(packets):
+        if not isinstance(workout_type, str) or workout_type not in bounds:
+            errors.add(row, ERR_WORKOUT_TYPE)
+            continue
+        len_arguments, type_bounds = bounds[workout_type]
+        if not isinstance(data, PACKET_DATA_TYPES):
+            errors.add(row, ERR_ARGUMENT_KIND)
+            continue
+        if len(data) != len_arguments:
+            errors.add(row, ERR_ARGUMENT_COUNT)
+            continue
+        for column, value in enumerate(data):
+            if type(value) not in NUMERIC_TYPES:
+                errors.add(row, ERR_ARGUMENT_KIND, column)
+                break
+        else:
+            for column, lower, strict in type_bounds:
+                value = data[column]
+                if not (value > lower or (not strict and value == lower)):
+                    errors.add(row, ERR_ARGUMENT_RANGE, column)
+                    break
+    return errors
+
+
+def compute_batch(
+    workout_type: str,
+    columns: Mapping[str, Sequence[float]],
+    typecode: str = 'd'
+) -> BatchInfo:
+    if typecode not in BATCH_TYPECODES:
+        raise ValueError(MESSAGE_ERR_TYPECODE.format(
+            typecode=typecode, typecodes=BATCH_TYPECODES
+        ))
+    if workout_type not in PACK_ACTIONS:
+        raise ValueError(
+            MESSAGE_ERR_TYPE_ACT.format(workout_type=workout_type)
+        )
+
+    action_type, _ = PACK_ACTIONS[workout_type]
+    field_names = [field.name for field in fields(action_type)]
+    missing_columns = [
+        name for name in field_names if name not in columns
+    ]
+    if missing_columns:
+        raise ValueError(
+            MESSAGE_ERR_BATCH_COLUMNS.format(
+                action_class=action_type.__name__,
+                missing_columns=missing_columns
+            )
+        )
+
+    column_lengths = {name: len(columns[name]) for name in field_names}
+    if len(set(column_lengths.values())) > 1:
+        raise ValueError(
+            MESSAGE_ERR_BATCH_LENGTH.format(
+                action_class=action_type.__name__,
+                column_lengths=column_lengths
+            )
+        )
+
+    if typecode != 'd':
+        columns = {
+            name: array(typecode, columns[name]) for name in field_names
+        }
+    spec = getattr(action_type, 'SPEC', None)
+    if spec is not None:
+        return spec.compute_batch(columns, typecode)
+
+    distance = action_type.get_batch_distance(columns, typecode)
+    speed = action_type.get_batch_mean_speed(columns, distance, typecode)
+    return BatchInfo(
+        action_type.__name__,
+        columns['duration'],
+        distance,
+        speed,
+        action_type.get_batch_spent_calories(columns, speed, typecode)
+    )
+
+
+def compare_batch_precision(
+    workout_type: str,
+    columns: Mapping[str, Sequence[float]],
+    typecode: str = 'f'
+) -> List[Tuple[int, str, str]]:
+    reference = render_batch_lines(compute_batch(workout_type, columns))
+    reduced = render_batch_lines(
+        compute_batch(workout_type, columns, typecode)
+    )
+    return [
+        (row, reference_line, reduced_line)
+        for row, (reference_line, reduced_line)
+        in enumerate(zip(reference, reduced))
+        if reference_line != reduced_line
+    ]
+
+
+class TrainingSession:
+    def __init__(self, workout_type: str, **profile: float) -> None:
+        if workout_type not in PACK_ACTIONS:
+            raise ValueError(
+                MESSAGE_ERR_TYPE_ACT.format(workout_type=workout_type)
+            )
+
+        self.action_type, _ = PACK_ACTIONS[workout_type]
+        self.field_names = [
+            action_field.name for action_field in fields(self.action_type)
+        ]
+        missing_fields = [
+            name for name in self.field_names
+            if name not in SESSION_COUNTERS
+            and name != 'duration'
+            and name not in profile
+        ]
+        if missing_fields:
+            raise ValueError(MESSAGE_ERR_SESSION_PROFILE.format(
+                action_class=self.action_type.__name__,
+                missing_fields=missing_fields
+            ))
+
+        self.profile = profile
+        self.action = 0
+        self.count_pool = 0
+        self.samples = 0
+        self.started: Optional[float] = None
+        self.last_timestamp: Optional[float] = None
+
+    def add_sample(
+        self, timestamp: float, action: float = 0, count_pool: int = 0
+    ) -> None:
+        if self.started is None:
+            # Счётчики выборки относятся к интервалу, которым она
+            # заканчивается; первая выборка только запускает отсчёт.
+            self.started = self.last_timestamp = timestamp
+            self.samples += 1
+            return
+        if timestamp < self.last_timestamp:
+            raise ValueError(MESSAGE_ERR_SESSION_ORDER.format(
+                timestamp=timestamp, last_timestamp=self.last_timestamp
+            ))
+        self.last_timestamp = timestamp
+        self.samples += 1
+        self.action += action
+        self.count_pool += count_pool
+
+    @property
+    def duration(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.last_timestamp - self.started) / SECONDS_IN_HOUR
+
+    def to_training(self) -> Training:
+        duration = self.duration
+        if duration <= 0:
+            raise ValueError(MESSAGE_ERR_SESSION_EMPTY.format(
+                action_class=self.action_type.__name__
+            ))
+        values = {
+            **self.profile,
+            'action': self.action,
+            'count_pool': self.count_pool,
+            'duration': duration
+        }
+        return self.action_type(
+            *[values[name] for name in self.field_names]
+        )
+
+    def get_distance(self) -> float:
+        return self.to_training().get_distance()
+
+    def get_mean_speed(self) -> float:
+        return self.to_training().get_mean_speed()
+
+    def get_spent_calories(self) -> float:
+        return self.to_training().get_spent_calories()
+
+    def show_training_info(self) -> InfoMessage:
+        return self.to_training().show_training_info()
+
+
+class TrainingTable:
+    def __init__(
+        self, workout_type: str, rows: Iterable[Sequence[float]] = ()
+    ) -> None:
+        if workout_type not in PACK_ACTIONS:
+            raise ValueError(
+                MESSAGE_ERR_TYPE_ACT.format(workout_type=workout_type)
+            )
+
+        self.workout_type = workout_type
+        self.action_type, self.len_arguments = PACK_ACTIONS[workout_type]
+        self.columns = {
+            field.name: array('d') for field in fields(self.action_type)
+        }
+        self.extend(rows)
+
+    def __len__(self) -> int:
+        return len(self.columns['action'])
+
+    def __getitem__(self, index: int) -> Training:
+        return self.action_type(
+            *[column[index] for column in self.columns.values()]
+        )
+
+    def __iter__(self) -> Iterator[Training]:
+        for row in zip(*self.columns.values()):
+            yield self.action_type(*row)
+
+    def append(self, data: Sequence[float]) -> None:
+        if self.len_arguments != len(data):
+            raise ValueError(
+                MESSAGE_ERR_TYPE_ARGUMEN.format(
+                    action_class=self.action_type.__name__,
+                    len_argument_false=len(data),
+                    len_argument_true=self.len_arguments,
+                    argument_return=data
+                )
+            )
+
+        for column, value in zip(self.columns.values(), data):
+            column.append(value)
+
+    def extend(self, rows: Iterable[Sequence[float]]) -> None:
+        for data in rows:
+            self.append(data)
+
+    def compute(self) -> BatchInfo:
+        return compute_batch(self.workout_type, self.columns)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(
+            column.itemsize * len(column)
+            for column in self.columns.values()
+        )
+
+
+def corrupt_packet(packet: Packet, generator: 'random.Random') -> Packet:
+    workout_type, data = packet
+    corruption = generator.randrange(3)
+    if corruption == 0:
+        return 'XXX', data
+    if corruption == 1:
+        return workout_type, data[:-1]
+    return workout_type, [data[0], 0, *data[2:]]
+
+
+def generate_packets(
+    count: int,
+    seed: int = 0,
+    malformed_rate: float = 0.0,
+    mix: Mapping[str, float] = SYNTHETIC_MIX,
+    ranges: Mapping[str, Tuple[float, float]] = SYNTHETIC_RANGES
+) -> Iterator[Packet]:
+    import random
+
+    generator = random.Random(seed)
+    workout_types = list(mix)
+    layouts = {
+        workout_type: [
+            (
+                action_field.name in SYNTHETIC_INTEGER_FIELDS,
+                *ranges[action_field.name]
+            )
+            for action_field in fields(PACK_CONSTRUCTORS[workout_type])
+        ]
+        for workout_type in workout_types
+    }
+    weights = list(mix.values())
+    uniform = generator.uniform
+    randint = generator.randint
+    for start in range(0, count, STREAM_CHUNK_SIZE):
+        chunk = generator.choices(
+            workout_types, weights=weights,
+            k=min(STREAM_CHUNK_SIZE, count - start)
+        )
+        for workout_type in chunk:
+            packet = workout_type, [
+                randint(low, high) if integer
+                else round(uniform(low, high), 3)
+                for integer, low, high in layouts[workout_type]
+            ]
+            if malformed_rate and generator.random() < malformed_rate:
+                packet = corrupt_packet(packet, generator)
+            yield packet
+
+
+def format_packet(packet: Packet, packet_format: str = 'jsonl') -> str:
+    if packet_format == 'jsonl':
+        return json.dumps(packet)
+    if packet_format == 'csv':
+        workout_type, data = packet
+        return ','.join([workout_type, *map(str, data)])
+    raise ValueError(MESSAGE_ERR_FORMAT.format(packet_format=packet_format))
+
+
+def write_packets(
+    path: str, packets: Iterable[Packet], packet_format: str = 'jsonl'
+) -> int:
+    count = 0
+    with open(path, 'w', encoding='utf-8') as target:
+        for chunk in iter_chunks(packets):
+            target.write(''.join([
+                format_packet(packet, packet_format) + '\n'
+                for packet in chunk
+            ]))
+            count += len(chunk)
+    return count
+
+
+def parse_value(value: str) -> float:
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def parse_packet(line: str, packet_format: str = 'jsonl') -> Packet:
+    try:
+        if packet_format == 'jsonl':
+            packet = json.loads(line)
+            if isinstance(packet, dict):
+                workout_type, data = packet['workout_type'], packet['data']
+            else:
+                workout_type, data = packet
+            if not isinstance(data, list):
+                raise TypeError(data)
+            return workout_type, data
+        if packet_format == 'csv':
+            workout_type, *data = next(csv.reader([line]))
+            return workout_type, [parse_value(value) for value in data]
+    except (KeyError, TypeError, ValueError, StopIteration):
+        raise ValueError(MESSAGE_ERR_PACKET.format(line=line.strip()))
+    raise ValueError(MESSAGE_ERR_FORMAT.format(packet_format=packet_format))
+
+
+def iter_chunks(
+    items: Iterable, chunk_size: int = STREAM_CHUNK_SIZE
+) -> Iterator[list]:
+    items = iter(items)
+    return iter(lambda: list(islice(items, chunk_size)), [])
+
+
+class PacketDeduplicator:
+    def __init__(self, capacity: int = DEDUP_CAPACITY) -> None:
+        import hashlib
+
+        self.capacity = capacity
+        self.digest = partial(hashlib.blake2b, digest_size=DEDUP_DIGEST_SIZE)
+        self.packers: Dict[int, Callable[..., bytes]] = {}
+        self.ring = array('Q')
+        self.head = 0
+        self.keys = array('Q', [0]) * DEDUP_TABLE_SIZE
+        self.positions = array('I', [0]) * DEDUP_TABLE_SIZE
+        self.size = 0
+        self.seen = 0
+        self.suppressed = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def key(self, workout_type: str, data: Sequence[float]) -> int:
+        pack = self.packers.get(len(data))
+        if pack is None:
+            pack = self.packers[len(data)] = struct.Struct(
+                f'<{len(data)}d'
+            ).pack
+        try:
+            record = pack(*data)
+        except (struct.error, OverflowError):
+            record = repr(data).encode()
+        digest = self.digest(workout_type.encode() + b'\x00' + record)
+        return int.from_bytes(digest.digest(), 'little') or 1
+
+    def find(self, key: int) -> int:
+        keys = self.keys
+        mask = len(keys) - 1
+        index = key & mask
+        while keys[index] and keys[index] != key:
+            index = (index + 1) & mask
+        return index
+
+    def delete(self, index: int) -> None:
+        keys = self.keys
+        positions = self.positions
+        mask = len(keys) - 1
+        probe = index
+        while True:
+            probe = (probe + 1) & mask
+            key = keys[probe]
+            if not key:
+                break
+            if (probe - key) & mask >= (probe - index) & mask:
+                keys[index] = key
+                positions[index] = positions[probe]
+                index = probe
+        keys[index] = 0
+        self.size -= 1
+
+    def resize(self, table_size: int) -> None:
+        entries = [
+            (key, position)
+            for key, position in zip(self.keys, self.positions) if key
+        ]
+        self.keys = array('Q', [0]) * table_size
+        self.positions = array('I', [0]) * table_size
+        for key, position in entries:
+            index = self.find(key)
+            self.keys[index] = key
+            self.positions[index] = position
+
+    def is_duplicate(self, workout_type: str, data: Sequence[float]) -> bool:
+        self.seen += 1
+        if self.capacity <= 0:
+            return False
+
+        key = self.key(workout_type, data)
+        head = self.head
+        self.head = (head + 1) % self.capacity
+        if head < len(self.ring):
+            expired = self.ring[head]
+            self.ring[head] = key
+            if expired != key:
+                index = self.find(expired)
+                if self.positions[index] == head and self.keys[index]:
+                    self.delete(index)
+        else:
+            self.ring.append(key)
+
+        index = self.find(key)
+        if self.keys[index]:
+            self.positions[index] = head
+            self.suppressed += 1
+            return True
+
+        if 2 * (self.size + 1) > len(self.keys):
+            self.resize(2 * len(self.keys))
+            index = self.find(key)
+        self.keys[index] = key
+        self.positions[index] = head
+        self.size += 1
+        return False
+
+    def filter(self, packets: Iterable[Packet]) -> Iterator[Packet]:
+        for workout_type, data in packets:
+            if not self.is_duplicate(workout_type, data):
+                yield workout_type, data
+
+    @property
+    def memory_bytes(self) -> int:
+        return sum(
+            sys.getsizeof(buffer)
+            for buffer in (self.ring, self.keys, self.positions)
+        )
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'seen': self.seen,
+            'suppressed': self.suppressed,
+            'size': self.size,
+            'capacity': self.capacity,
+            'memory_bytes': self.memory_bytes
+        }
+
+
+def parse_chunk(
+    chunk: Iterable[str],
+    packet_format: str,
+    dead_letter: Optional[DeadLetterSink]
+) -> Tuple[List[str], List[Packet]]:
+    parsed_lines = []
+    packets = []
+    for line in chunk:
+        if not line.strip():
+            continue
+        try:
+            packets.append(parse_packet(line, packet_format))
+        except ValueError as error:
+            if dead_letter is not None:
+                dead_letter(line, error)
+            continue
+        parsed_lines.append(line)
+    return parsed_lines, packets
+
+
+def read_stream_lines(
+    lines: Iterable[str],
+    packet_format: str = 'jsonl',
+    dead_letter: Optional[DeadLetterSink] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    deduplicator: Optional[PacketDeduplicator] = None
+) -> Iterator[Tuple[str, Training]]:
+    if packet_format not in PACKET_FORMATS:
+        raise ValueError(
+            MESSAGE_ERR_FORMAT.format(packet_format=packet_format)
+        )
+
+    for chunk in iter_chunks(lines, chunk_size):
+        parsed_lines, packets = parse_chunk(chunk, packet_format, dead_letter)
+        errors = validate_packets(packets)
+        invalid_rows = dict(zip(errors.rows, range(len(errors))))
+        for row, (line, packet) in enumerate(zip(parsed_lines, packets)):
+            if row in invalid_rows:
+                if dead_letter is not None:
+                    dead_letter(
+                        line, ValueError(errors.message(invalid_rows[row]))
+                    )
+                continue
+            if deduplicator is not None and deduplicator.is_duplicate(
+                *packet
+            ):
+                continue
+            yield line, read_package(*packet, trusted=True)
+
+
+def read_stream(
+    lines: Iterable[str],
+    packet_format: str = 'jsonl',
+    dead_letter: Optional[DeadLetterSink] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    deduplicator: Optional[PacketDeduplicator] = None
+) -> Iterator[Training]:
+    for _, training in read_stream_lines(
+        lines, packet_format, dead_letter, chunk_size, deduplicator
+    ):
+        yield training
+
+
+def stream_training_info(
+    lines: Iterable[str],
+    packet_format: str = 'jsonl',
+    dead_letter: Optional[DeadLetterSink] = None,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+    deduplicator: Optional[PacketDeduplicator] = None
+) -> Iterator[InfoMessage]:
+    for line, training in read_stream_lines(
+        lines, packet_format, dead_letter, chunk_size, deduplicator
+    ):
+        try:
+            message = training.show_training_info()
+        except ArithmeticError as error:
+            if dead_letter is not None:
+                dead_letter(line, ValueError(
+                    MESSAGE_ERR_CALCULATION.format(error=error)
+                ))
+            continue
+        yield message
+
+
+def render_messages(messages: Iterable[InfoMessage]) -> str:
+    line = INFO_MESSAGE_LINE.format
+    return ''.join([
+        line(
+            training_type=message.training_type,
+            duration=message.duration,
+            distance=message.distance,
+            speed=message.speed,
+            calories=message.calories
+        )
+        for message in messages
+    ])
+
+
+def render_batch_lines(batch: BatchInfo) -> List[str]:
+    line = INFO_MESSAGE_LINE.format
+    return [
+        line(
+            training_type=batch.training_type,
+            duration=duration,
+            distance=distance,
+            speed=speed,
+            calories=calories
+        )
+        for duration, distance, speed, calories in zip(
+            batch.duration, batch.distance, batch.speed, batch.calories
+        )
+    ]
+
+
+def render_batch(batch: BatchInfo) -> str:
+    return ''.join(render_batch_lines(batch))
+
+
+def render_packets(packets: Sequence[Packet], trusted: bool = False) -> str:
+    indexes: Dict[str, List[int]] = {}
+    for index, (workout_type, data) in enumerate(packets):
+        if not trusted:
+            check_package(workout_type, data)
+        indexes.setdefault(workout_type, []).append(index)
+
+    lines = [''] * len(packets)
+    for workout_type, type_indexes in indexes.items():
+        rows = [packets[index][1] for index in type_indexes]
+        batch = compute_batch(workout_type, {
+            field.name: column
+            for field, column in zip(
+                fields(PACK_CONSTRUCTORS[workout_type]), zip(*rows)
+            )
+        })
+        for index, line in zip(type_indexes, render_batch_lines(batch)):
+            lines[index] = line
+    return ''.join(lines)
+
+
+class BatchWorkerPool:
+    def __init__(self, threads: int = WORKER_THREADS) -> None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+
+    def __enter__(self) -> 'BatchWorkerPool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def submit(self, packets: Sequence[Packet]) -> 'Future':
+        return self.executor.submit(render_packets, packets)
+
+    def map(self, batches: Iterable[Sequence[Packet]]) -> Iterator[str]:
+        return self.executor.map(render_packets, batches)
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+
+def write_messages(stream: TextIO, messages: Iterable[InfoMessage]) -> int:
+    return stream.write(render_messages(messages))
+
+
+def pack_binary_record(workout_type: str, data: Sequence[float]) -> bytes:
+    check_package(workout_type, data)
+    code = workout_type.encode('ascii')
+    if len(code) > BINARY_CODE_WIDTH or len(data) > BINARY_SLOTS:
+        raise ValueError(MESSAGE_ERR_BINARY_RECORD.format(
+            workout_type=workout_type,
+            code_width=BINARY_CODE_WIDTH,
+            slots=BINARY_SLOTS
+        ))
+    return BINARY_RECORD.pack(
+        code, *data, *repeat(0.0, BINARY_SLOTS - len(data))
+    )
+
+
+def unpack_binary_code(code: bytes) -> str:
+    workout_type = code.rstrip(b'\x00').decode('ascii', 'replace')
+    if workout_type not in PACK_ACTIONS:
+        raise ValueError(
+            MESSAGE_ERR_TYPE_ACT.format(workout_type=workout_type)
+        )
+    return workout_type
+
+
+def write_binary_packets(path: str, packets: Iterable[Packet]) -> int:
+    count = 0
+    with open(path, 'wb') as target:
+        target.write(BINARY_HEADER)
+        for chunk in iter_chunks(packets):
+            records = [
+                pack_binary_record(workout_type, data)
+                for workout_type, data in chunk
+            ]
+            target.write(b''.join(records))
+            count += len(records)
+    return count
+
+
+def convert_packets(
+    source_path: str,
+    target_path: str,
+    packet_format: str = 'jsonl',
+    dead_letter: Optional[DeadLetterSink] = None
+) -> int:
+    def parse(source: Iterable[str]) -> Iterator[Packet]:
+        for line in source:
+            if not line.strip():
+                continue
+            try:
+                packet = parse_packet(line, packet_format)
+                check_package(*packet)
+            except ValueError as error:
+                if dead_letter is not None:
+                    dead_letter(line, error)
+                continue
+            yield packet
+
+    with open(source_path, encoding='utf-8') as source:
+        return write_binary_packets(target_path, parse(source))
+
+
+class BinaryPacketReader:
+    def __init__(self, path: str) -> None:
+        import mmap
+
+        with open(path, 'rb') as source:
+            if os.fstat(source.fileno()).st_size < len(BINARY_HEADER):
+                raise ValueError(MESSAGE_ERR_BINARY_HEADER.format(path=path))
+            self.mmap = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mmap)
+        if self.view[:len(BINARY_HEADER)] != BINARY_HEADER:
+            self.close()
+            raise ValueError(MESSAGE_ERR_BINARY_HEADER.format(path=path))
+        self.records = self.view[len(BINARY_HEADER):]
+        if len(self.records) % BINARY_RECORD.size:
+            self.close()
+            raise ValueError(MESSAGE_ERR_BINARY_SIZE.format(
+                path=path, size=BINARY_RECORD.size
+            ))
+
+    def __enter__(self) -> 'BinaryPacketReader':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return len(self.records) // BINARY_RECORD.size
+
+    def __iter__(self) -> Iterator[Packet]:
+        layouts: Dict[bytes, Tuple[str, int]] = {}
+        for code, *values in BINARY_RECORD.iter_unpack(self.records):
+            layout = layouts.get(code)
+            if layout is None:
+                workout_type = unpack_binary_code(code)
+                layout = layouts[code] = (
+                    workout_type, PACK_ACTIONS[workout_type][1]
+                )
+            workout_type, len_arguments = layout
+            yield workout_type, values[:len_arguments]
+
+    def close(self) -> None:
+        if hasattr(self, 'records'):
+            self.records.release()
+        self.view.release()
+        self.mmap.close()
+
+    def trainings(self) -> Iterator[Training]:
+        for workout_type, data in self:
+            yield read_package(workout_type, data, trusted=True)
+
+    def columns(self) -> Dict[str, Dict[str, array]]:
+        rows: Dict[bytes, list] = {}
+        for record in BINARY_RECORD.iter_unpack(self.records):
+            rows.setdefault(record[0], []).append(record)
+
+        columns = {}
+        for code, type_rows in rows.items():
+            workout_type = unpack_binary_code(code)
+            columns[workout_type] = {
+                field.name: array('d', column)
+                for field, column in zip(
+                    fields(PACK_CONSTRUCTORS[workout_type]),
+                    islice(zip(*type_rows), 1, None)
+                )
+            }
+        return columns
+
+
+def process_file(path: str, packet_format: str = 'jsonl') -> ArchiveSummary:
+    summary = ArchiveSummary()
+
+    def dead_letter(line: str, error: ValueError) -> None:
+        summary.rejected += 1
+
+    with open(path, encoding='utf-8') as source:
+        for message in stream_training_info(
+            source, packet_format, dead_letter
+        ):
+            summary.add(message)
+    return summary
+
+
+def code_state(code: 'types.CodeType') -> list:
+    import types
+
+    constants = []
+    for constant in code.co_consts:
+        if isinstance(constant, types.CodeType):
+            constant = code_state(constant)
+        elif isinstance(constant, frozenset):
+            constant = sorted(map(repr, constant))
+        constants.append(constant)
+    return [code.co_code.hex(), code.co_names, constants]
+
+
+def formula_code(action_type: type, method: str) -> list:
+    import inspect
+
+    return code_state(inspect.unwrap(getattr(action_type, method)).__code__)
+
+
+def formula_state(action_type: type) -> dict:
+    spec = getattr(action_type, 'SPEC', None)
+    return {
+        'class': action_type.__name__,
+        'fields': [
+            action_field.name for action_field in fields(action_type)
+        ],
+        'constants': {
+            **workout_constants(action_type),
+            **(spec.constants if spec is not None else {})
+        },
+        'code': [
+            formula_code(action_type, method) for method in TRAINING_METHODS
+        ],
+        'expressions': [
+            spec.distance, spec.speed, spec.calories
+        ] if spec is not None else []
+    }
+
+
+def formula_fingerprint() -> str:
+    import hashlib
+
+    formulas = {
+        workout_type: formula_state(action_type)
+        for workout_type, action_type in PACK_CONSTRUCTORS.items()
+    }
+    formulas['bounds'] = FIELD_LOWER_BOUNDS
+    return hashlib.sha256(
+        json.dumps(formulas, sort_keys=True, default=repr).encode('utf-8')
+    ).hexdigest()
+
+
+def file_digest(path: str) -> str:
+    import hashlib
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(FILE_DIGEST_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    def __init__(
+        self, path: str, max_entries: int = RESULT_CACHE_SIZE
+    ) -> None:
+        import sqlite3
+
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            ' file_hash TEXT, fingerprint TEXT, packet_format TEXT,'
+            ' summary TEXT, used INTEGER,'
+            ' PRIMARY KEY (file_hash, fingerprint, packet_format))'
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self) -> 'ResultCache':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute(
+            'SELECT COUNT(*) FROM results'
+        ).fetchone()[0]
+
+    def next_used(self) -> int:
+        return self.connection.execute(
+            'SELECT COALESCE(MAX(used), 0) + 1 FROM results'
+        ).fetchone()[0]
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[ArchiveSummary]:
+        row = self.connection.execute(
+            'SELECT summary FROM results WHERE file_hash = ?'
+            ' AND fingerprint = ? AND packet_format = ?',
+            key
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self.connection:
+            self.connection.execute(
+                'UPDATE results SET used = ? WHERE file_hash = ?'
+                ' AND fingerprint = ? AND packet_format = ?',
+                (self.next_used(), *key)
+            )
+        return ArchiveSummary.from_dict(json.loads(row[0]))
+
+    def put(
+        self, key: Tuple[str, str, str], summary: ArchiveSummary
+    ) -> None:
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+                (*key, json.dumps(summary.to_dict()), self.next_used())
+            )
+            self.connection.execute(
+                'DELETE FROM results WHERE rowid NOT IN ('
+                ' SELECT rowid FROM results ORDER BY used DESC LIMIT ?)',
+                (self.max_entries,)
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+def summarize_files(
+    paths: List[str], workers: int, packet_format: str
+) -> List[ArchiveSummary]:
+    if workers > 1 and len(paths) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(
+                process_file, paths, repeat(packet_format)
+            ))
+    return list(map(process_file, paths, repeat(packet_format)))
+
+
+def process_archive(
+    paths: Iterable[str],
+    workers: int = 1,
+    packet_format: str = 'jsonl',
+    cache: Optional[ResultCache] = None
+) -> ArchiveSummary:
+    paths = list(paths)
+    summaries: List[Optional[ArchiveSummary]] = [None] * len(paths)
+    keys = []
+    if cache is not None:
+        fingerprint = formula_fingerprint()
+        keys = [
+            (file_digest(path), fingerprint, packet_format) for path in paths
+        ]
+        summaries = [cache.get(key) for key in keys]
+
+    missing = [
+        index for index, summary in enumerate(summaries) if summary is None
+    ]
+    computed = summarize_files(
+        [paths[index] for index in missing], workers, packet_format
+    )
+    for index, summary in zip(missing, computed):
+        summaries[index] = summary
+        if cache is not None:
+            cache.put(keys[index], summary)
+
+    archive = ArchiveSummary()
+    for summary in summaries:
+        archive.merge(summary)
+    return archive
+
+
+def render_response(text: str, packet_format: str) -> str:
+    packet = parse_packet(text, packet_format)
+    errors = validate_packets([packet])
+    if errors:
+        raise ValueError(errors.message(0))
+    return read_package(*packet, trusted=True).show_training_info(
+    ).get_message() + '\n'
+
+
+def render_responses(
+    lines: Iterable[bytes], packet_format: str = 'jsonl'
+) -> str:
+    responses = []
+    for line in lines:
+        if len(line) > SERVER_READ_SIZE:
+            responses.append(SERVER_ERROR_LINE.format(
+                error=MESSAGE_ERR_SERVER_LINE.format(limit=SERVER_READ_SIZE)
+            ))
+            continue
+        try:
+            text = line.decode('utf-8')
+            if not text.strip():
+                continue
+            responses.append(render_response(text, packet_format))
+        except (ValueError, ArithmeticError, TypeError) as error:
+            responses.append(SERVER_ERROR_LINE.format(error=error))
+    return ''.join(responses)
+
+
+async def handle_packets(
+    reader: 'asyncio.StreamReader',
+    writer: 'asyncio.StreamWriter',
+    packet_format: str = 'jsonl'
+) -> None:
+    pending = b''
+    discarding = False
+    try:
+        while True:
+            data = await reader.read(SERVER_READ_SIZE)
+            if not data:
+                break
+            if discarding:
+                _, separator, data = data.partition(b'\n')
+                if not separator:
+                    continue
+                discarding = False
+            *lines, pending = (pending + data).split(b'\n')
+            response = render_responses(lines, packet_format)
+            if len(pending) > SERVER_READ_SIZE:
+                response += SERVER_ERROR_LINE.format(
+                    error=MESSAGE_ERR_SERVER_LINE.format(
+                        limit=SERVER_READ_SIZE
+                    )
+                )
+                pending = b''
+                discarding = True
+            if response:
+                writer.write(response.encode('utf-8'))
+                await writer.drain()
+        if pending:
+            writer.write(
+                render_responses([pending], packet_format).encode('utf-8')
+            )
+            await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+
+
+async def serve_packets(
+    host: str = '127.0.0.1',
+    port: int = 0,
+    path: Optional[str] = None,
+    packet_format: str = 'jsonl'
+) -> 'asyncio.AbstractServer':
+    import asyncio
+
+    handler = partial(handle_packets, packet_format=packet_format)
+    if path is not None:
+        return await asyncio.start_unix_server(handler, path)
+    return await asyncio.start_server(handler, host, port)
+
+
+async def serve_forever(address: str, packet_format: str = 'jsonl') -> None:
+    host, separator, port = address.rpartition(':')
+    if separator:
+        server = await serve_packets(
+            host, int(port), packet_format=packet_format
+        )
+    else:
+        server = await serve_packets(path=address, packet_format=packet_format)
+    async with server:
+        await server.serve_forever()
+
+
+def npy_header(descr: str, rows: int) -> bytes:
+    header = NPY_HEADER.format(descr=descr, rows=rows)
+    padding = NPY_HEADER_SIZE - len(NPY_MAGIC) - 2 - len(header) - 1
+    header = (header + ' ' * padding + '\n').encode('latin1')
+    return NPY_MAGIC + struct.pack('<H', len(header)) + header
+
+
+class ColumnarWriter:
+    def __init__(
+        self, directory: str, chunk_size: int = STREAM_CHUNK_SIZE
+    ) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.rows = 0
+        self.files = {}
+        self.buffers = {name: [] for name in NPY_COLUMNS}
+        for name, descr in NPY_COLUMNS.items():
+            column_file = open(os.path.join(directory, f'{name}.npy'), 'wb')
+            column_file.write(npy_header(descr, 0))
+            self.files[name] = column_file
+
+    def __enter__(self) -> 'ColumnarWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def write(self, message: InfoMessage) -> None:
+        for name, buffer in self.buffers.items():
+            buffer.append(getattr(message, name))
+        if len(self.buffers['duration']) >= self.chunk_size:
+            self.flush()
+
+    def write_batch(self, batch: BatchInfo) -> None:
+        self.write_rows(
+            [batch.training_type] * len(batch.distance),
+            batch.duration,
+            batch.distance,
+            batch.speed,
+            batch.calories
+        )
+
+    def write_rows(self, *columns: Sequence) -> None:
+        for buffer, column in zip(self.buffers.values(), columns):
+            buffer.extend(column)
+        if len(self.buffers['duration']) >= self.chunk_size:
+            self.flush()
+
+    def flush(self) -> None:
+        training_types = self.buffers['training_type']
+        for training_type in set(training_types):
+            if len(training_type) > NPY_TYPE_WIDTH:
+                raise ValueError(MESSAGE_ERR_NPY_WIDTH.format(
+                    training_type=training_type, width=NPY_TYPE_WIDTH
+                ))
+        self.files['training_type'].write(''.join([
+            training_type.ljust(NPY_TYPE_WIDTH, '\0')
+            for training_type in training_types
+        ]).encode('utf-32-le'))
+        for name, buffer in self.buffers.items():
+            if name != 'training_type':
+                column = array('d', buffer)
+                if sys.byteorder == 'big':
+                    column.byteswap()
+                self.files[name].write(column.tobytes())
+        self.rows += len(training_types)
+        for buffer in self.buffers.values():
+            buffer.clear()
+
+    def close(self) -> None:
+        if not self.files:
+            return
+        self.flush()
+        for name, column_file in self.files.items():
+            column_file.seek(0)
+            column_file.write(npy_header(NPY_COLUMNS[name], self.rows))
+            column_file.close()
+        self.files = {}
+
+
+def read_npy(path: str) -> Tuple[str, bytes]:
+    import ast
+
+    with open(path, 'rb') as source:
+        content = source.read()
+    if not content.startswith(NPY_MAGIC):
+        raise ValueError(MESSAGE_ERR_NPY_HEADER.format(path=path))
+    header_size, = struct.unpack_from('<H', content, len(NPY_MAGIC))
+    header_end = len(NPY_MAGIC) + 2 + header_size
+    header = ast.literal_eval(
+        content[len(NPY_MAGIC) + 2:header_end].decode('latin1')
+    )
+    return header['descr'], content[header_end:]
+
+
+def read_columnar(directory: str) -> Dict[str, Sequence]:
+    columns = {}
+    for name in NPY_COLUMNS:
+        descr, data = read_npy(os.path.join(directory, f'{name}.npy'))
+        if descr == '<f8':
+            column = array('d')
+            column.frombytes(data)
+            if sys.byteorder == 'big':
+                column.byteswap()
+        else:
+            width = int(descr[2:])
+            text = data.decode('utf-32-le')
+            column = [
+                text[start:start + width].rstrip('\0')
+                for start in range(0, len(text), width)
+            ]
+        columns[name] = column
+    return columns
+
+
+def iter_columnar_messages(directory: str) -> Iterator[InfoMessage]:
+    columns = read_columnar(directory)
+    for row in zip(*[columns[name] for name in NPY_COLUMNS]):
+        yield InfoMessage(*row)
+
+
+def main(training: Training) -> None:
+    print(
+        training.
+        show_training_info().
+        get_message()
+    )
+
+
+@dataclass
+class StageStats:
+    count: int = 0
+    total_ns: int = 0
+    histogram: Dict[int, int] = field(default_factory=dict)
+
+    def record(self, elapsed_ns: int) -> None:
+        self.count += 1
+        self.total_ns += elapsed_ns
+        upper_bound = 1 << elapsed_ns.bit_length()
+        self.histogram[upper_bound] = self.histogram.get(upper_bound, 0) + 1
+
+    def snapshot(self) -> dict:
+        return {
+            'count': self.count,
+            'total_ns': self.total_ns,
+            'mean_ns': self.total_ns / self.count if self.count else 0.0,
+            'histogram': dict(sorted(self.histogram.items()))
+        }
+
+
+class Instrumentation:
+    def __init__(self) -> None:
+        self.stages: Dict[str, StageStats] = {}
+        self.originals: List[Tuple[object, str, Callable]] = []
+
+    def targets(self) -> List[Tuple[object, str, str]]:
+        module = sys.modules[__name__]
+        return [
+            (module, 'parse_packet', 'parse_packet'),
+            (module, 'read_package', 'read_package'),
+            *[
+                (action_type, 'get_spent_calories',
+                 f'{action_type.__name__}.get_spent_calories')
+                for action_type in PACK_CONSTRUCTORS.values()
+                if 'get_spent_calories' in vars(action_type)
+            ],
+            (Training, 'show_training_info', 'show_training_info'),
+            (InfoMessage, 'get_message', 'get_message'),
+        ]
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.originals)
+
+    def enable(self) -> None:
+        if self.enabled:
+            return
+        for owner, attribute, stage in self.targets():
+            function = vars(owner)[attribute]
+            self.originals.append((owner, attribute, function))
+            setattr(owner, attribute, self.timed(stage, function))
+
+    def disable(self) -> None:
+        while self.originals:
+            owner, attribute, function = self.originals.pop()
+            setattr(owner, attribute, function)
+
+    def timed(self, stage: str, function: Callable) -> Callable:
+        stats = self.stages.setdefault(stage, StageStats())
+        clock = time.perf_counter_ns
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                stats.record(clock() - start)
+        return wrapper
+
+    def reset(self) -> None:
+        for stats in self.stages.values():
+            stats.count = 0
+            stats.total_ns = 0
+            stats.histogram.clear()
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            stage: stats.snapshot() for stage, stats in self.stages.items()
+        }
+
+
+INSTRUMENTATION = Instrumentation()
+
+
+def open_sources(paths: Iterable[str]) -> Iterator[TextIO]:
+    for path in paths:
+        if path == '-':
+            yield sys.stdin
+            continue
+        with open(path, encoding='utf-8') as source:
+            yield source
+
+
+def run_packets(args: 'argparse.Namespace') -> None:
+    if not args.paths:
+        packages = [
+            ('SWM', [720, 1, 80, 25, 40]),
+            ('RUN', [15000, 1, 75]),
+            ('WLK', [9000, 1, 75, 180])
+        ]
+
+        for workout_type, data in packages:
+            main(read_package(workout_type, data))
+        return
+
+    dead_letter_stream = (
+        open(args.dead_letter, 'a', encoding='utf-8')
+        if args.dead_letter else sys.stderr
+    )
+
+    deduplicator = PacketDeduplicator(args.dedup) if args.dedup else None
+
+    def dead_letter(line: str, error: ValueError) -> None:
+        dead_letter_stream.write(f'{line.rstrip()}\t{error}\n')
+
+    messages = (
+        message
+        for source in open_sources(args.paths)
+        for message in stream_training_info(
+            source, args.packet_format, dead_letter, args.chunk_size,
+            deduplicator
+        )
+    )
+    try:
+        if args.columnar:
+            with ColumnarWriter(args.columnar, args.chunk_size) as writer:
+                for message in messages:
+                    writer.write(message)
+        else:
+            for message in messages:
+                print(message.get_message())
+    finally:
+        messages.close()
+        if dead_letter_stream is not sys.stderr:
+            dead_letter_stream.close()
+        if deduplicator is not None:
+            json.dump(deduplicator.stats(), sys.stderr)
+            sys.stderr.write('\n')
+
+
+def run_profiled(args: 'argparse.Namespace') -> None:
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    profiler.runcall(run_packets, args)
+    if args.profile == '-':
+        pstats.Stats(profiler, stream=sys.stderr).sort_stats(
+            'cumulative'
+        ).print_stats(PROFILE_TOP)
+    else:
+        profiler.dump_stats(args.profile)
+
+
+def run(argv: Optional[Sequence[str]] = None) -> int:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description='Обработка пакетов фитнес-трекера.'
+    )
+    parser.add_argument(
+        'paths', nargs='*', metavar='path',
+        help='файлы с пакетами, "-" для чтения из stdin'
+    )
+    parser.add_argument(
+        '--format', dest='packet_format',
+        choices=PACKET_FORMATS, default='jsonl'
+    )
+    parser.add_argument(
+        '--chunk-size', type=int, default=STREAM_CHUNK_SIZE
+    )
+    parser.add_argument(
+        '--dead-letter',
+        help='файл для отбракованных пакетов, по умолчанию stderr'
+    )
+    parser.add_argument(
+        '--dedup', type=int, metavar='CAPACITY',
+        help='пропускать повторы среди последних CAPACITY пакетов'
+    )
+    parser.add_argument(
+        '--columnar', metavar='DIR',
+        help='записать результаты в колонки .npy вместо печати'
+    )
+    parser.add_argument(
+        '--serve', metavar='ADDRESS',
+        help='принимать пакеты по сети: HOST:PORT или путь к unix-сокету'
+    )
+    parser.add_argument(
+        '--profile', nargs='?', const='-', metavar='FILE',
+        help='запустить под cProfile: сводка в stderr или дамп в FILE'
+    )
+    parser.add_argument(
+        '--stats', action='store_true',
+        help='вывести в stderr счётчики и гистограммы этапов обработки'
+    )
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        import asyncio
+
+        asyncio.run(serve_forever(args.serve, args.packet_format))
+        return 0
+
+    if args.stats:
+        INSTRUMENTATION.enable()
+    try:
+        if args.profile is not None:
+            run_profiled(args)
+        else:
+            run_packets(args)
+    finally:
+        if args.stats:
+            INSTRUMENTATION.disable()
+            json.dump(
+                INSTRUMENTATION.snapshot(), sys.stderr,
+                indent=2, ensure_ascii=False
+            )
+            sys.stderr.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
@@ -0,0 +1,137 @@
+import argparse
+import contextlib
+import os
+import sys
+import time
+from typing import Iterable, Iterator, Optional
+
+import homework
+
+BINARY_FORMAT = 'binary'
+REPORT_MESSAGE = (
+    'Обработано пакетов: {processed:,}; отбраковано: {rejected:,}; '
+    'ошибок при расчёте: {failed:,}; '
+    'время: {elapsed:.3f} с; пропускная способность: '
+    '{throughput:,.0f} пакетов/с (цель: {rate})'
+)
+
+
+def generate(args: argparse.Namespace) -> None:
+    packets = homework.generate_packets(
+        args.count, args.seed, args.malformed_rate
+    )
+    start = time.perf_counter()
+    if args.packet_format == BINARY_FORMAT:
+        count = homework.write_binary_packets(args.path, packets)
+    else:
+        count = homework.write_packets(args.path, packets, args.packet_format)
+    elapsed = time.perf_counter() - start
+    print(f'Записано пакетов: {count:,} за {elapsed:.3f} с')
+
+
+def read_trainings(
+    path: str, packet_format: str, dead_letter: homework.DeadLetterSink
+) -> Iterator[homework.Training]:
+    if packet_format == BINARY_FORMAT:
+        with homework.BinaryPacketReader(path) as reader:
+            yield from reader.trainings()
+        return
+    with open(path, encoding='utf-8') as source:
+        yield from homework.read_stream(source, packet_format, dead_letter)
+
+
+def paced(
+    trainings: Iterable[homework.Training], rate: Optional[float]
+) -> Iterator[homework.Training]:
+    start = time.perf_counter()
+    for index, training in enumerate(trainings):
+        if rate:
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        yield training
+
+
+def replay(args: argparse.Namespace) -> None:
+    rejected = 0
+
+    def dead_letter(line: str, error: ValueError) -> None:
+        nonlocal rejected
+        rejected += 1
+
+    processed = failed = 0
+    start = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull:
+        with contextlib.redirect_stdout(sys.stdout if args.echo else devnull):
+            for training in paced(
+                read_trainings(args.path, args.packet_format, dead_letter),
+                args.rate
+            ):
+                try:
+                    homework.main(training)
+                except ArithmeticError:
+                    failed += 1
+                    continue
+                processed += 1
+    elapsed = time.perf_counter() - start
+    print(REPORT_MESSAGE.format(
+        processed=processed,
+        rejected=rejected,
+        failed=failed,
+        elapsed=elapsed,
+        throughput=processed / elapsed if elapsed else 0.0,
+        rate=f'{args.rate:,.0f} пакетов/с' if args.rate else 'без ограничения'
+    ), file=sys.stderr)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description='Генератор нагрузки для модуля фитнес-трекера.'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    formats = [*homework.PACKET_FORMATS, BINARY_FORMAT]
+
+    generate_parser = commands.add_parser(
+        'generate', help='записать синтетические пакеты в файл'
+    )
+    generate_parser.add_argument('path')
+    generate_parser.add_argument('--count', type=int, default=1_000_000)
+    generate_parser.add_argument('--seed', type=int, default=0)
+    generate_parser.add_argument(
+        '--malformed-rate', type=float, default=0.0,
+        help='доля испорченных пакетов, только для текстовых форматов'
+    )
+    generate_parser.add_argument(
+        '--format', dest='packet_format', choices=formats, default='jsonl'
+    )
+    generate_parser.set_defaults(handler=generate)
+
+    replay_parser = commands.add_parser(
+        'replay', help='прогнать файл через read_package и main'
+    )
+    replay_parser.add_argument('path')
+    replay_parser.add_argument(
+        '--rate', type=float,
+        help='целевая скорость, пакетов в секунду; по умолчанию без паузы'
+    )
+    replay_parser.add_argument(
+        '--format', dest='packet_format', choices=formats, default='jsonl'
+    )
+    replay_parser.add_argument(
+        '--echo', action='store_true', help='печатать сообщения main'
+    )
+    replay_parser.set_defaults(handler=replay)
+
+    args = parser.parse_args(argv)
+    if (
+        args.command == 'generate'
+        and args.packet_format == BINARY_FORMAT
+        and args.malformed_rate
+    ):
+        parser.error('--malformed-rate не поддерживается для формата binary')
+    args.handler(args)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,17 @@
+import asyncio
+import bisect
+import json
+import pickle
+import random
 import re
+import subprocess
+import sys
 import pytest
 import types
 import inspect
+from dataclasses import asdict, replace
+from io import StringIO
+from pathlib import Path
 from conftest import Capturing
 
 try:
@@ -419,3 +429,993 @@ def test_main_output(input_data, expected):
     assert get_message_output == expected, (
         'Метод `main` должен печатать результат в консоль.\n'
     )
+
+
+@pytest.mark.parametrize('workout_type, packages', [
+    ('SWM', [[720, 1, 80, 25, 40], [1206, 12, 6, 12, 3]]),
+    ('RUN', [[15000, 1, 75], [420, 4, 20], [1206, 12, 6]]),
+    ('WLK', [[9000, 1, 75, 180], [3000.33, 2.512, 75.8, 180.1]]),
+])
+def test_compute_batch(workout_type, packages):
+    action_type, _ = homework.PACK_ACTIONS[workout_type]
+    names = [field.name for field in homework.fields(action_type)]
+    columns = {
+        name: [data[index] for data in packages]
+        for index, name in enumerate(names)
+    }
+    result = homework.compute_batch(workout_type, columns)
+    assert result.training_type == action_type.__name__
+    for row, data in enumerate(packages):
+        training = homework.read_package(workout_type, data)
+        assert result.distance[row] == training.get_distance(), (
+            'Пакетный расчёт дистанции должен совпадать с `get_distance`.'
+        )
+        assert result.speed[row] == training.get_mean_speed(), (
+            'Пакетный расчёт скорости должен совпадать с `get_mean_speed`.'
+        )
+        assert result.calories[row] == training.get_spent_calories(), (
+            'Пакетный расчёт калорий должен совпадать '
+            'с `get_spent_calories`.'
+        )
+
+
+@pytest.mark.parametrize('workout_type, columns', [
+    ('XXX', {'action': [1], 'duration': [1], 'weight': [1]}),
+    ('RUN', {'action': [1], 'duration': [1]}),
+    ('RUN', {'action': [1, 2], 'duration': [1], 'weight': [1]}),
+])
+def test_compute_batch_errors(workout_type, columns):
+    with pytest.raises(ValueError):
+        homework.compute_batch(workout_type, columns)
+
+
+@pytest.mark.parametrize('line, packet_format, expected', [
+    ('["SWM", [720, 1, 80, 25, 40]]', 'jsonl',
+        ('SWM', [720, 1, 80, 25, 40])),
+    ('{"workout_type": "RUN", "data": [15000, 1, 75]}', 'jsonl',
+        ('RUN', [15000, 1, 75])),
+    ('WLK,9000,1.5,75,180', 'csv', ('WLK', [9000, 1.5, 75, 180])),
+])
+def test_parse_packet(line, packet_format, expected):
+    assert homework.parse_packet(line, packet_format) == expected
+
+
+def test_stream_training_info_dead_letter():
+    lines = [
+        '["SWM", [720, 1, 80, 25, 40]]\n',
+        'not a packet\n',
+        '["XXX", [1, 2, 3]]\n',
+        '\n',
+        '["RUN", [1206, 12]]\n',
+        '["WLK", [9000, 1, 75, 180]]\n',
+    ]
+    dead_letters = []
+    result = homework.stream_training_info(
+        iter(lines),
+        dead_letter=lambda line, error: dead_letters.append(line),
+        chunk_size=2
+    )
+    assert isinstance(result, types.GeneratorType), (
+        '`stream_training_info` должна быть генератором.'
+    )
+    assert [message.training_type for message in result] == [
+        'Swimming', 'SportsWalking'
+    ]
+    assert dead_letters == [lines[1], lines[2], lines[4]], (
+        'Отбракованные пакеты должны попадать в `dead_letter`.'
+    )
+
+
+def test_stream_training_info_overflow(tmp_path):
+    lines = [
+        '["WLK", [1e300, 1, 75, 180]]\n',
+        '["RUN", [15000, 1, 75]]\n',
+    ]
+    dead_letters = []
+    messages = list(homework.stream_training_info(
+        lines, dead_letter=lambda line, error: dead_letters.append(
+            (line, error)
+        )
+    ))
+    assert [message.training_type for message in messages] == ['Running']
+    assert [line for line, _ in dead_letters] == [lines[0]], (
+        'Пакет с переполнением в формулах должен попадать в `dead_letter`.'
+    )
+    assert isinstance(dead_letters[0][1], ValueError)
+
+    path = tmp_path / 'packets.jsonl'
+    path.write_text(''.join(lines), encoding='utf-8')
+    summary = homework.process_file(str(path))
+    assert summary.rejected == 1
+    assert summary.totals['Running'].count == 1
+
+
+def test_run_stream(tmp_path):
+    path = tmp_path / 'packets.csv'
+    path.write_text('RUN,1206,12,6\nRUN,1\n', encoding='utf-8')
+    with Capturing() as output:
+        homework.run([str(path), '--format', 'csv'])
+    assert output == [
+        'Тип тренировки: Running; '
+        'Длительность: 12.000 ч.; '
+        'Дистанция: 0.784 км; '
+        'Ср. скорость: 0.065 км/ч; '
+        'Потрачено ккал: 12.812.'
+    ]
+
+
+def test_TrainingTable():
+    packages = [[9000, 1, 75, 180], [3000.33, 2.512, 75.8, 180.1]]
+    table = homework.TrainingTable('WLK', packages)
+    assert len(table) == len(packages)
+    assert table.nbytes == 8 * 4 * len(packages), (
+        'Колонки `TrainingTable` должны храниться в `array`.'
+    )
+    for row, data in zip(table, packages):
+        training = homework.SportsWalking(*data)
+        assert row.show_training_info() == training.show_training_info()
+    assert table[1].get_spent_calories() == (
+        homework.SportsWalking(*packages[1]).get_spent_calories()
+    )
+    assert list(table.compute().calories) == [
+        row.get_spent_calories() for row in table
+    ]
+    with pytest.raises(ValueError):
+        table.append([1, 2])
+
+
+def test_render_messages():
+    packages = [
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('RUN', [1206, 12, 6]),
+        ('WLK', [3000.33, 2.512, 75.8, 180.1]),
+    ]
+    messages = [
+        homework.read_package(*package).show_training_info()
+        for package in packages
+    ]
+    expected = ''.join(
+        homework.INFO_MESSAGE.format(**asdict(message)) + '\n'
+        for message in messages
+    )
+    assert homework.render_messages(messages) == expected, (
+        '`render_messages` должна совпадать с `INFO_MESSAGE`.'
+    )
+    writes = []
+
+    class Stream(StringIO):
+        def write(self, text):
+            writes.append(text)
+            return super().write(text)
+
+    stream = Stream()
+    homework.write_messages(stream, messages)
+    assert writes == [expected], (
+        '`write_messages` должна записывать сообщения одним вызовом.'
+    )
+
+
+def test_render_batch():
+    packages = [[9000, 1, 75, 180], [3000.33, 2.512, 75.8, 180.1]]
+    table = homework.TrainingTable('WLK', packages)
+    expected = ''.join(
+        homework.SportsWalking(*data).show_training_info().get_message()
+        + '\n'
+        for data in packages
+    )
+    assert homework.render_batch(table.compute()) == expected
+
+
+@pytest.mark.parametrize('input_data, expected', [
+    (('SWM', [720, 1, 80, 25, 40]), 'Swimming'),
+    (('RUN', [15000, 1, 75]), 'Running'),
+    (('WLK', [9000, 1, 75, 180]), 'SportsWalking'),
+])
+def test_read_package_trusted(input_data, expected):
+    result = homework.read_package(*input_data, trusted=True)
+    assert result == homework.read_package(*input_data)
+    assert result.__class__.__name__ == expected
+
+
+def test_read_packages():
+    packages = [
+        ('RUN', [15000, 1, 75]),
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('RUN', [1206, 12, 6]),
+    ]
+    result = homework.read_packages(packages)
+    assert result == {
+        'RUN': [homework.Running(15000, 1, 75), homework.Running(1206, 12, 6)],
+        'SWM': [homework.Swimming(720, 1, 80, 25, 40)],
+    }
+    assert homework.read_packages(packages, trusted=True) == result
+    for bad_packages in (
+        [('RUN', [15000, 1])],
+        [('XXX', [1, 2, 3])],
+    ):
+        with pytest.raises(ValueError):
+            homework.read_packages(bad_packages)
+
+
+def test_process_archive(tmp_path):
+    files = {
+        'a.jsonl': [
+            '["RUN", [15000, 1, 75]]',
+            '["WLK", [3000.33, 2.512, 75.8, 180.1]]',
+            '["XXX", [1]]',
+        ],
+        'b.jsonl': [
+            '["RUN", [1206, 12, 6]]',
+            '["SWM", [720, 1, 80, 25, 40]]',
+        ],
+        'c.jsonl': [
+            '["WLK", [9000, 1.5, 75, 180]]',
+            '["RUN", [1]]',
+            '["RUN", [15000, 0, 75]]',
+            '["RUN", ["abc", 1, 75]]',
+        ],
+    }
+    paths = []
+    for name, lines in files.items():
+        path = tmp_path / name
+        path.write_text('\n'.join(lines), encoding='utf-8')
+        paths.append(str(path))
+
+    result = homework.process_archive(paths)
+    assert result.rejected == 4, (
+        'Пакеты с нулевой длительностью и нечисловыми полями '
+        'должны отбраковываться, а не прерывать обработку.'
+    )
+    assert sorted(result.totals) == ['Running', 'SportsWalking', 'Swimming']
+    running = result.totals['Running']
+    assert running.count == 2
+    assert running.duration == 13
+    assert running.distance == (
+        homework.Running(15000, 1, 75).get_distance()
+        + homework.Running(1206, 12, 6).get_distance()
+    )
+    assert homework.process_archive(paths, workers=2) == result, (
+        'Результат `process_archive` не должен зависеть '
+        'от количества процессов.'
+    )
+
+
+def test_binary_packets(tmp_path):
+    source = tmp_path / 'packets.csv'
+    source.write_text(
+        'SWM,720,1,80,25,40\n'
+        'RUN,1\n'
+        'RUN,15000,1,75\n'
+        'WLK,3000.33,2.512,75.8,180.1\n',
+        encoding='utf-8'
+    )
+    target = str(tmp_path / 'packets.bin')
+    dead_letters = []
+    count = homework.convert_packets(
+        str(source), target, 'csv',
+        lambda line, error: dead_letters.append(line)
+    )
+    assert count == 3
+    assert dead_letters == ['RUN,1\n']
+
+    expected = [
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('RUN', [15000, 1, 75]),
+        ('WLK', [3000.33, 2.512, 75.8, 180.1]),
+    ]
+    with homework.BinaryPacketReader(target) as reader:
+        assert len(reader) == 3
+        assert list(reader) == expected
+        assert [
+            training.show_training_info() for training in reader.trainings()
+        ] == [
+            homework.read_package(*packet).show_training_info()
+            for packet in expected
+        ]
+        columns = reader.columns()
+        assert list(columns['RUN']['weight']) == [75]
+        batch = homework.compute_batch('WLK', columns['WLK'])
+        assert batch.calories[0] == homework.SportsWalking(
+            *expected[2][1]
+        ).get_spent_calories()
+
+
+def test_binary_packets_errors(tmp_path):
+    path = tmp_path / 'packets.bin'
+    with pytest.raises(ValueError):
+        homework.write_binary_packets(str(path), [('RUN', [1, 2])])
+    path.write_bytes(b'not a binary archive')
+    with pytest.raises(ValueError):
+        homework.BinaryPacketReader(str(path))
+    path.write_bytes(b'')
+    with pytest.raises(ValueError, match='не является бинарным архивом'):
+        homework.BinaryPacketReader(str(path))
+
+    homework.write_binary_packets(str(path), [('RUN', [15000, 1, 75])])
+    content = path.read_bytes()
+    path.write_bytes(content[:-1])
+    with pytest.raises(ValueError, match='обрезан'):
+        homework.BinaryPacketReader(str(path))
+
+    header = len(homework.BINARY_HEADER)
+    path.write_bytes(content[:header] + b'XXX' + content[header + 3:])
+    with homework.BinaryPacketReader(str(path)) as reader:
+        with pytest.raises(ValueError, match='XXX'):
+            list(reader)
+        with pytest.raises(ValueError, match='XXX'):
+            reader.columns()
+
+
+def test_binary_packets_codes(tmp_path, monkeypatch):
+    for name in ('WORKOUT_REGISTRY', 'PACK_ACTIONS', 'PACK_CONSTRUCTORS'):
+        monkeypatch.setattr(homework, name, dict(getattr(homework, name)))
+    for code, extra in (('YOGA', ()), ('RW', ()), ('TRI', ('a', 'b', 'c'))):
+        homework.register_workout(homework.WorkoutSpec(
+            code, f'Workout{code}',
+            ('action', 'duration', 'weight', *extra),
+            distance='action / 1000',
+            speed='distance / duration',
+            calories='speed * weight',
+            constants={}
+        ))
+    path = str(tmp_path / 'packets.bin')
+    for packet in (('YOGA', [1, 1, 75]), ('TRI', [1, 1, 75, 1, 2, 3])):
+        with pytest.raises(ValueError, match='не помещается'):
+            homework.write_binary_packets(path, [packet])
+
+    assert homework.write_binary_packets(path, [('RW', [2000, 1, 75])]) == 1
+    with homework.BinaryPacketReader(path) as reader:
+        assert list(reader) == [('RW', [2000, 1, 75])], (
+            'Короткий код тренировки должен читаться без нулевых байтов.'
+        )
+        assert list(reader.columns()['RW']['action']) == [2000]
+
+
+def test_serve_packets():
+    async def exchange():
+        server = await homework.serve_packets()
+        host, port = server.sockets[0].getsockname()[:2]
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write(
+            b'["RUN", [1206, 12, 6]]\n'
+            b'["RUN", [15000, 0, 75]]\n'
+            b'["RUN", "abc"]\n'
+            b'["XXX", [1]]\n'
+            b'\n'
+            + b'x' * (3 * homework.SERVER_READ_SIZE) + b'\n'
+            b'["SWM", [720, 1, 80, 25, 40]]'
+        )
+        writer.write_eof()
+        response = await reader.read()
+        writer.close()
+        server.close()
+        await server.wait_closed()
+        return response.decode('utf-8').splitlines()
+
+    response = asyncio.run(exchange())
+    assert response == [
+        homework.Running(1206, 12, 6).show_training_info().get_message(),
+        'Ошибка: В классе Running недопустимое значение duration: 0',
+        'Ошибка: Не удалось разобрать пакет: \'["RUN", "abc"]\'',
+        'Ошибка: Передан не верный тип тренировки: XXX',
+        'Ошибка: Строка пакета длиннее 65536 байт',
+        homework.Swimming(
+            720, 1, 80, 25, 40
+        ).show_training_info().get_message(),
+    ], 'Сервер должен отвечать на каждый пакет отдельной строкой.'
+
+
+def test_cached_training_info():
+    homework.packet_cache_clear()
+    for _ in range(3):
+        result = homework.cached_training_info('WLK', [9000, 1, 75, 180])
+    assert result == homework.SportsWalking(
+        9000, 1, 75, 180
+    ).show_training_info()
+    result.calories = 0
+    assert homework.cached_training_info(
+        'WLK', [9000, 1, 75, 180]
+    ).calories != 0
+    info = homework.packet_cache_info()
+    assert (info.hits, info.misses) == (3, 1)
+
+
+def test_RollingAggregator():
+    day = homework.SECONDS_IN_DAY
+    aggregator = homework.RollingAggregator(windows=(7, 30))
+    run = homework.Running(15000, 1, 75)
+    for offset in (0, 0.5, 10, 20, 25):
+        aggregator.add_training('user', offset * day, run)
+    aggregator.add_training('other', 25 * day, run)
+
+    week = aggregator.totals('user', 'Running', 7)
+    month = aggregator.totals('user', 'Running', 30)
+    assert week.count == 2
+    assert month.count == 5
+    assert month.distance == pytest.approx(5 * run.get_distance())
+    assert week.mean_speed == pytest.approx(run.get_mean_speed())
+    assert aggregator.totals('user', 'Running', 30, now=35 * day).count == 3
+    assert aggregator.totals('user', 'Swimming', 7).count == 0
+
+    restored = homework.RollingAggregator.restore(
+        json.loads(json.dumps(aggregator.snapshot()))
+    )
+    for user_id in ('user', 'other'):
+        for days in (7, 30):
+            assert vars(restored.totals(user_id, 'Running', days)) == (
+                pytest.approx(vars(aggregator.totals(user_id, 'Running', days)))
+            ), 'Восстановленный агрегатор должен совпадать с исходным.'
+
+    with pytest.raises(ValueError):
+        aggregator.add_training('user', 0, run)
+    with pytest.raises(ValueError):
+        aggregator.totals('user', 'Running', 14)
+
+    queried = homework.RollingAggregator(windows=(7, 30))
+    queried.add_training('user', 0, run)
+    assert queried.totals('user', 'Running', 7, now=8 * day).count == 0
+    queried.add_training('user', 0.5 * day, run)
+    queried.add_training('user', 10 * day, run)
+    assert queried.totals('user', 'Running', 7).count == 1, (
+        'Запрос с now не должен изменять окна агрегатора.'
+    )
+    assert queried.totals('user', 'Running', 30, now=50 * day).count == 0
+    with pytest.raises(ValueError):
+        queried.add_training('user', 9 * day, run)
+
+
+def test_Instrumentation():
+    instrumentation = homework.Instrumentation()
+    read_package = homework.read_package
+    get_message = homework.InfoMessage.get_message
+    instrumentation.enable()
+    try:
+        assert homework.read_package is not read_package
+        list(homework.stream_training_info([
+            '["RUN", [15000, 1, 75]]',
+            '["WLK", [9000, 1, 75, 180]]',
+            '["RUN", [1206, 12, 6]]',
+        ]))
+        homework.Running(15000, 1, 75).show_training_info().get_message()
+    finally:
+        instrumentation.disable()
+    assert homework.read_package is read_package, (
+        'После отключения инструментирования функции должны '
+        'восстанавливаться.'
+    )
+    assert homework.InfoMessage.get_message is get_message
+
+    snapshot = instrumentation.snapshot()
+    assert snapshot['parse_packet']['count'] == 3
+    assert snapshot['read_package']['count'] == 3
+    assert snapshot['Running.get_spent_calories']['count'] == 3
+    assert snapshot['SportsWalking.get_spent_calories']['count'] == 1
+    assert snapshot['show_training_info']['count'] == 4
+    assert snapshot['get_message']['count'] == 1
+    assert sum(snapshot['read_package']['histogram'].values()) == 3
+
+
+@pytest.mark.parametrize('workout_type, data', [
+    ('SWM', [720, 1, 80, 25, 40]),
+    ('SWM', [1206, 12, 6, 12, 3]),
+    ('RUN', [15000, 1, 75]),
+    ('RUN', [1206, 12, 6]),
+    ('WLK', [9000, 1.5, 75, 180]),
+    ('WLK', [3000.33, 2.512, 75.8, 180.1]),
+])
+def test_workout_registry(workout_type, data):
+    spec = homework.WORKOUT_REGISTRY[workout_type]
+    expected = homework.read_package(workout_type, data).show_training_info()
+    assert spec.compute(data) == expected, (
+        'Скомпилированная формула должна совпадать с классом тренировки.'
+    )
+    batch = spec.compute_batch({
+        name: [value] for name, value in zip(spec.fields, data)
+    })
+    assert (
+        batch.distance[0], batch.speed[0], batch.calories[0]
+    ) == (expected.distance, expected.speed, expected.calories)
+
+
+def test_register_workout(monkeypatch):
+    for name in ('WORKOUT_REGISTRY', 'PACK_ACTIONS', 'PACK_CONSTRUCTORS'):
+        monkeypatch.setattr(homework, name, dict(getattr(homework, name)))
+    spec = homework.WorkoutSpec(
+        'ROW', 'Rowing',
+        ('action', 'duration', 'weight', 'stroke_length'),
+        distance='action * stroke_length / M_IN_KM',
+        speed='distance / duration',
+        calories='CALORIES_SPEED_MULTIPLIER * speed * weight * duration',
+        constants={'M_IN_KM': 1000, 'CALORIES_SPEED_MULTIPLIER': 1.5}
+    )
+    rowing = homework.register_workout(spec)
+    assert rowing.__name__ == 'Rowing'
+    assert issubclass(rowing, homework.Training)
+
+    training = homework.read_package('ROW', [600, 0.5, 80, 10])
+    assert isinstance(training, rowing)
+    assert training.get_distance() == 6
+    assert training.get_mean_speed() == 12
+    assert training.get_spent_calories() == 1.5 * 12 * 80 * 0.5
+    assert training.show_training_info().training_type == 'Rowing'
+
+    batch = homework.compute_batch('ROW', {
+        'action': [600], 'duration': [0.5],
+        'weight': [80], 'stroke_length': [10],
+    })
+    assert list(batch.calories) == [training.get_spent_calories()]
+    with pytest.raises(ValueError):
+        homework.register_workout(spec)
+    with pytest.raises(ValueError):
+        homework.WorkoutSpec(
+            'BAD', 'Bad', ('duration',), '0', '0', '0', {}
+        )
+
+
+def test_columnar_export(tmp_path):
+    packages = [
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('RUN', [1206, 12, 6]),
+        ('WLK', [3000.33, 2.512, 75.8, 180.1]),
+    ]
+    messages = [
+        homework.read_package(*package).show_training_info()
+        for package in packages
+    ]
+    table = homework.TrainingTable('RUN', [[15000, 1, 75], [420, 4, 20]])
+    directory = str(tmp_path / 'results')
+    with homework.ColumnarWriter(directory, chunk_size=2) as writer:
+        for message in messages:
+            writer.write(message)
+        writer.write_batch(table.compute())
+
+    expected = messages + [training.show_training_info() for training in table]
+    assert list(homework.iter_columnar_messages(directory)) == expected, (
+        'Колонки должны сохранять результаты без потери точности.'
+    )
+    columns = homework.read_columnar(directory)
+    assert columns['training_type'] == [
+        message.training_type for message in expected
+    ]
+    with open(tmp_path / 'results' / 'calories.npy', 'rb') as column:
+        header = column.read(homework.NPY_HEADER_SIZE)
+    assert header.startswith(b'\x93NUMPY')
+    assert b"'shape': (5,)" in header
+
+
+def test_BatchWorkerPool():
+    packages = [
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('RUN', [1206, 12, 6]),
+        ('WLK', [3000.33, 2.512, 75.8, 180.1]),
+        ('RUN', [15000, 1, 75]),
+    ]
+    expected = ''.join(
+        homework.read_package(*package).show_training_info().get_message()
+        + '\n'
+        for package in packages
+    )
+    assert homework.render_packets(packages) == expected, (
+        '`render_packets` должна сохранять порядок пакетов.'
+    )
+    with homework.BatchWorkerPool(threads=2) as pool:
+        assert list(pool.map([packages, packages[1:]])) == [
+            expected, expected[expected.index('\n') + 1:]
+        ]
+        with pytest.raises(ValueError):
+            pool.submit([('RUN', [1])]).result()
+
+
+def test_run_many_files(tmp_path):
+    paths = []
+    for name, line in (
+        ('a.csv', 'RUN,1206,12,6\n'),
+        ('b.csv', 'SWM,720,1,80,25,40\n'),
+    ):
+        path = tmp_path / name
+        path.write_text(line, encoding='utf-8')
+        paths.append(str(path))
+    with Capturing() as output:
+        homework.run([*paths, '--format', 'csv'])
+    assert output == [
+        homework.Running(1206, 12, 6).show_training_info().get_message(),
+        homework.Swimming(
+            720, 1, 80, 25, 40
+        ).show_training_info().get_message(),
+    ], '`run` должна обрабатывать несколько файлов за один запуск.'
+
+
+def test_lazy_imports():
+    result = subprocess.run(
+        [
+            sys.executable, '-c',
+            'import sys, homework; '
+            'print(sorted(set(sys.modules) & {'
+            '"argparse", "asyncio", "concurrent.futures", "cProfile"}))'
+        ],
+        capture_output=True, text=True, check=True,
+        cwd=str(Path(homework.__file__).parent)
+    )
+    assert result.stdout.strip() == '[]', (
+        'Тяжёлые модули должны импортироваться только при использовании.'
+    )
+
+
+def test_PacketDeduplicator():
+    deduplicator = homework.PacketDeduplicator(capacity=2)
+    packets = [
+        ('RUN', [15000, 1, 75]),
+        ('RUN', [15000, 1, 75]),
+        ('WLK', [9000, 1, 75, 180]),
+        ('RUN', [15000, 1, 75]),
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('WLK', [9000, 1, 75, 180]),
+        ('RUN', [15000, 1, 75]),
+    ]
+    assert list(deduplicator.filter(packets)) == [
+        packets[0], packets[2], packets[4], packets[5], packets[6]
+    ], 'Повторы должны отбрасываться в пределах ёмкости индекса.'
+    stats = deduplicator.stats()
+    assert stats['seen'] == len(packets)
+    assert stats['suppressed'] == 2
+    assert stats['size'] == 2
+    assert stats['memory_bytes'] > 0
+
+
+def test_PacketDeduplicator_hash_collision():
+    deduplicator = homework.PacketDeduplicator()
+    packets = [('RUN', [-2, 1, 75]), ('RUN', [-1, 1, 75])]
+    assert hash(tuple(packets[0][1])) == hash(tuple(packets[1][1]))
+    assert list(deduplicator.filter(packets)) == packets, (
+        'Разные пакеты с одинаковым hash() не должны считаться повторами.'
+    )
+    assert deduplicator.is_duplicate('RUN', [-2.0, 1.0, 75.0]), (
+        'Целые и дробные записи одного значения должны совпадать.'
+    )
+    assert len(deduplicator) == 2
+    assert deduplicator.memory_bytes < 1024
+
+
+def test_read_stream_deduplicator():
+    deduplicator = homework.PacketDeduplicator()
+    lines = ['["RUN", [15000, 1, 75]]'] * 3 + ['["RUN", [1206, 12, 6]]']
+    result = list(homework.read_stream(lines, deduplicator=deduplicator))
+    assert result == [
+        homework.Running(15000, 1, 75), homework.Running(1206, 12, 6)
+    ]
+    assert deduplicator.suppressed == 2
+
+
+def test_validate_packets():
+    packets = [
+        ('SWM', [720, 1, 80, 25, 40]),
+        ('XXX', [1, 2, 3]),
+        ('RUN', [15000, 1]),
+        ('RUN', [15000, '1', 75]),
+        ('RUN', [15000, 0, 75]),
+        ('WLK', [9000, 1, 75, float('nan')]),
+        ('SWM', [720, 1, 80, 25, 0]),
+        ('RUN', [0, 1, 75]),
+        ('RUN', 5),
+        ('WLK', 'abcd'),
+    ]
+    errors = homework.validate_packets(packets)
+    assert list(errors.rows) == [1, 2, 3, 4, 5, 8, 9], (
+        '`validate_packets` должна находить все ошибочные пакеты.'
+    )
+    assert list(errors.codes) == [
+        homework.ERR_WORKOUT_TYPE,
+        homework.ERR_ARGUMENT_COUNT,
+        homework.ERR_ARGUMENT_KIND,
+        homework.ERR_ARGUMENT_RANGE,
+        homework.ERR_ARGUMENT_RANGE,
+        homework.ERR_ARGUMENT_KIND,
+        homework.ERR_ARGUMENT_KIND,
+    ]
+    messages = list(errors.messages())
+    assert messages[0] == 'Передан не верный тип тренировки: XXX'
+    with pytest.raises(ValueError) as error:
+        homework.read_package(*packets[2])
+    assert messages[1] == str(error.value)
+    assert 'duration' in messages[3]
+    assert 'height' in errors[4]
+    assert messages[5] == (
+        'В классе Running аргументы должны быть списком, получено: 5'
+    )
+    assert list(errors.valid()) == [packets[0], packets[6], packets[7]]
+
+
+@pytest.mark.parametrize('seed', [1, 2, 3])
+def test_QuantileSketch(seed):
+    generator = random.Random(seed)
+    values = [generator.lognormvariate(0, 1) for _ in range(50_000)]
+    parts = []
+    for part in range(4):
+        sketch = homework.QuantileSketch(seed=part)
+        sketch.update(values[part::4])
+        parts.append(homework.QuantileSketch.from_dict(
+            json.loads(json.dumps(sketch.to_dict()))
+        ))
+    merged = parts[0]
+    for sketch in parts[1:]:
+        merged.merge(sketch)
+    assert len(merged) == len(values)
+    assert merged.size() < len(values) // 50, (
+        'Скетч должен занимать память много меньше исходных данных.'
+    )
+
+    exact = sorted(values)
+    fractions = (0.01, 0.1, 0.5, 0.9, 0.99)
+    for fraction, estimate in zip(fractions, merged.quantiles(fractions)):
+        rank = bisect.bisect_left(exact, estimate) / len(exact)
+        assert abs(rank - fraction) <= 0.01, (
+            'Ошибка ранга квантиля должна быть не больше 1%.'
+        )
+
+
+def test_WorkoutQuantiles():
+    first = homework.WorkoutQuantiles()
+    second = homework.WorkoutQuantiles()
+    for action in range(1000, 11000, 10):
+        first.add(homework.Running(action, 1, 75).show_training_info())
+    table = homework.TrainingTable(
+        'RUN', [[action, 1, 75] for action in range(11000, 21000, 10)]
+    )
+    second.add_batch(table.compute())
+    first.merge(homework.WorkoutQuantiles.from_dict(
+        json.loads(json.dumps(second.to_dict()))
+    ))
+    median, = first.quantiles('Running', 'speed', [0.5])
+    assert median == pytest.approx(
+        homework.Running(11000, 1, 75).get_mean_speed(), rel=0.02
+    )
+
+
+def test_ResultCache(tmp_path, monkeypatch):
+    paths = []
+    for name, line in (
+        ('a.jsonl', '["RUN", [15000, 1, 75]]\n'),
+        ('b.jsonl', '["WLK", [9000, 1, 75, 180]]\n["XXX", [1]]\n'),
+    ):
+        path = tmp_path / name
+        path.write_text(line, encoding='utf-8')
+        paths.append(str(path))
+    expected = homework.process_archive(paths)
+
+    with homework.ResultCache(str(tmp_path / 'cache.sqlite')) as cache:
+        assert homework.process_archive(paths, cache=cache) == expected
+        assert (cache.hits, cache.misses) == (0, 2)
+    with homework.ResultCache(str(tmp_path / 'cache.sqlite')) as cache:
+        assert homework.process_archive(paths, cache=cache) == expected
+        assert (cache.hits, cache.misses) == (2, 0), (
+            'Повторная обработка должна брать результаты из кэша.'
+        )
+
+        monkeypatch.setattr(homework.Running, 'CALORIES_MEAN_SPEED_SHIFT', 2)
+        changed = homework.process_archive(paths, cache=cache)
+        assert (cache.hits, cache.misses) == (2, 2), (
+            'Изменение констант формул должно сбрасывать кэш.'
+        )
+        assert changed.totals['Running'].calories != (
+            expected.totals['Running'].calories
+        )
+
+
+def test_formula_fingerprint(monkeypatch):
+    fingerprint = homework.formula_fingerprint()
+    monkeypatch.setitem(homework.WORKOUT_REGISTRY, 'RUN', replace(
+        homework.WORKOUT_REGISTRY['RUN'], calories='0'
+    ))
+    assert homework.formula_fingerprint() == fingerprint, (
+        'Неиспользуемая запись реестра не должна менять отпечаток.'
+    )
+    homework.INSTRUMENTATION.enable()
+    try:
+        assert homework.formula_fingerprint() == fingerprint, (
+            'Обёртки инструментирования не должны менять отпечаток.'
+        )
+    finally:
+        homework.INSTRUMENTATION.disable()
+
+    def get_spent_calories(self):
+        return 0.0
+
+    monkeypatch.setattr(
+        homework.Running, 'get_spent_calories', get_spent_calories
+    )
+    assert homework.formula_fingerprint() != fingerprint, (
+        'Отпечаток должен учитывать исполняемый код формул.'
+    )
+
+
+def test_ResultCache_eviction(tmp_path):
+    summary = homework.ArchiveSummary(rejected=1)
+    with homework.ResultCache(
+        str(tmp_path / 'cache.sqlite'), max_entries=2
+    ) as cache:
+        for key in ('a', 'b', 'c'):
+            cache.put((key, 'fingerprint', 'jsonl'), summary)
+        assert len(cache) == 2
+        assert cache.get(('a', 'fingerprint', 'jsonl')) is None
+        assert cache.get(('c', 'fingerprint', 'jsonl')) == summary
+
+
+def test_TrainingSession():
+    session = homework.TrainingSession('SWM', weight=80, length_pool=25)
+    for second in range(0, 3601, 60):
+        session.add_sample(second, action=12, count_pool=second % 180 == 0)
+    assert session.samples == 61
+    assert session.duration == 1
+    expected = homework.Swimming(12 * 60, 1, 80, 25, 20)
+    assert session.to_training() == expected
+    assert session.show_training_info() == expected.show_training_info()
+    assert session.get_spent_calories() == expected.get_spent_calories()
+
+    walking = homework.TrainingSession('WLK', weight=75, height=180)
+    walking.add_sample(0)
+    with pytest.raises(ValueError):
+        walking.show_training_info()
+    walking.add_sample(5400, action=9000)
+    assert walking.get_mean_speed() == (
+        homework.SportsWalking(9000, 1.5, 75, 180).get_mean_speed()
+    )
+    with pytest.raises(ValueError):
+        walking.add_sample(10)
+    with pytest.raises(ValueError):
+        homework.TrainingSession('WLK', weight=75)
+
+
+def test_TopKIndex():
+    week = homework.TOP_BUCKET_SECONDS
+    first = homework.TopKIndex(k=3)
+    second = homework.TopKIndex(k=3)
+    messages = [
+        homework.Running(action, 1, 75).show_training_info()
+        for action in range(1000, 9000, 1000)
+    ]
+    for index, message in enumerate(messages):
+        (first if index % 2 else second).add(week + index, message)
+    first.add(0, messages[0])
+    first.add(2 * week, homework.Swimming(
+        720, 1, 80, 25, 40
+    ).show_training_info())
+
+    first.merge(pickle.loads(pickle.dumps(second)))
+    assert first.top('Running', 1) == messages[:-4:-1], (
+        'Индекс должен хранить K лучших тренировок по калориям.'
+    )
+    assert first.top('Running', 0) == [messages[0]]
+    assert first.top('Swimming', 2)[0].training_type == 'Swimming'
+    first.expire(before_bucket=1)
+    assert first.top('Running', 0) == []
+    assert len(first.top('Running', 1)) == 3
+
+
+def test_generate_packets(tmp_path):
+    first = list(homework.generate_packets(2000, seed=7, malformed_rate=0.1))
+    second = list(homework.generate_packets(2000, seed=7, malformed_rate=0.1))
+    assert first == second, (
+        'Одинаковый seed должен давать одинаковый набор пакетов.'
+    )
+    assert first != list(homework.generate_packets(2000, seed=8))
+    errors = homework.validate_packets(first)
+    assert 100 < len(errors) < 300, (
+        'Доля испорченных пакетов должна соответствовать malformed_rate.'
+    )
+    assert not homework.validate_packets(
+        list(homework.generate_packets(2000, seed=7))
+    )
+
+    path = tmp_path / 'packets.csv'
+    assert homework.write_packets(str(path), first, 'csv') == 2000
+    rejected = []
+    with open(path, encoding='utf-8') as source:
+        trainings = list(homework.read_stream(
+            source, 'csv', lambda line, error: rejected.append(line)
+        ))
+    assert len(trainings) + len(rejected) == 2000
+    assert len(rejected) == len(errors), (
+        'Поток должен отбраковывать те же пакеты, что и validate_packets.'
+    )
+    assert {type(training).__name__ for training in trainings} == {
+        'Running', 'SportsWalking', 'Swimming'
+    }
+
+
+def test_loadgen(tmp_path):
+    path = tmp_path / 'packets.bin'
+    loadgen = Path(homework.__file__).with_name('loadgen.py')
+    subprocess.run(
+        [sys.executable, str(loadgen), 'generate', str(path),
+         '--count', '500', '--format', 'binary'],
+        check=True, capture_output=True
+    )
+    result = subprocess.run(
+        [sys.executable, str(loadgen), 'replay', str(path),
+         '--format', 'binary'],
+        check=True, capture_output=True, text=True
+    )
+    assert 'Обработано пакетов: 500;' in result.stderr, (
+        'Replay должен прогнать все сгенерированные пакеты.'
+    )
+
+
+def test_compare_batch_precision():
+    columns = {}
+    for workout_type, data in homework.generate_packets(3000, seed=3):
+        action_type, _ = homework.PACK_ACTIONS[workout_type]
+        type_columns = columns.setdefault(workout_type, {
+            field.name: [] for field in homework.fields(action_type)
+        })
+        for column, value in zip(type_columns.values(), data):
+            column.append(value)
+
+    for workout_type, type_columns in columns.items():
+        reduced = homework.compute_batch(workout_type, type_columns, 'f')
+        assert reduced.calories.itemsize == 4, (
+            'Режим float32 должен хранить результаты в 4-байтовых массивах.'
+        )
+        assert not homework.compare_batch_precision(
+            workout_type, type_columns, 'd'
+        )
+        reference = homework.render_batch_lines(
+            homework.compute_batch(workout_type, type_columns)
+        )
+        rows = homework.compare_batch_precision(workout_type, type_columns)
+        assert [row for row, _, _ in rows] == [
+            row for row, line in enumerate(homework.render_batch_lines(
+                reduced
+            )) if line != reference[row]
+        ], 'Сравнение должно перечислять ровно расходящиеся строки.'
+        for row, reference_line, reduced_line in rows:
+            assert reference_line == reference[row]
+            for expected, actual in zip(
+                re.findall(r'\d+\.\d+', reference_line),
+                re.findall(r'\d+\.\d+', reduced_line)
+            ):
+                assert float(actual) == pytest.approx(
+                    float(expected), rel=1e-6, abs=1.1e-3
+                ), 'Расхождение float32 должно быть в последнем знаке.'
+
+    with pytest.raises(ValueError):
+        homework.compute_batch('RUN', columns['RUN'], 'q')
+
+
+def test_ProfileStore(tmp_path):
+    path = str(tmp_path / 'profiles.sqlite')
+    with homework.ProfileStore(path, capacity=1) as profiles:
+        profiles.update('anna', homework.UserProfile(75, 180))
+        profiles.update('oleg', homework.UserProfile(80))
+
+        assert homework.read_profile_package(
+            'RUN', 'anna', [15000, 1], profiles
+        ) == homework.Running(15000, 1, 75)
+        assert homework.read_profile_package(
+            'WLK', 'anna', [9000, 1], profiles
+        ) == homework.SportsWalking(9000, 1, 75, 180)
+        assert homework.read_profile_package(
+            'SWM', 'oleg', [720, 1, 25, 40], profiles
+        ) == homework.Swimming(720, 1, 80, 25, 40)
+        assert (profiles.hits, profiles.misses, len(profiles.recent)) == (
+            1, 2, 1
+        ), 'Кэш профилей должен быть ограниченным LRU.'
+
+        profiles.update('oleg', homework.UserProfile(90))
+        assert homework.read_profile_package(
+            'RUN', 'oleg', [15000, 1], profiles
+        ).weight == 90, 'Обновление профиля должно сбрасывать кэш.'
+
+        for workout_type, user_id, data in (
+            ('WLK', 'oleg', [9000, 1]),
+            ('RUN', 'ivan', [15000, 1]),
+            ('RUN', 'anna', [15000, 1, 75]),
+            ('XXX', 'anna', [15000, 1]),
+        ):
+            with pytest.raises(ValueError):
+                homework.read_profile_package(
+                    workout_type, user_id, data, profiles
+                )
+
+    with homework.ProfileStore(path) as profiles:
+        assert len(profiles) == 2, 'Профили должны сохраняться в файле.'
+        assert profiles.get('oleg') == homework.UserProfile(90)